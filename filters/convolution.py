@@ -0,0 +1,88 @@
+"""This module contains FFT based FIR filtering for filters with many taps."""
+
+import numpy as np
+from scipy.fft import irfft, next_fast_len, rfft
+from scipy.signal import lfilter, oaconvolve
+
+# direct convolution is cheaper up to this many taps, or samples, whatever the other
+DIRECT_MAX_TAPS = 128
+DIRECT_MAX_SAMPLES = 256
+# signals up to this many times the filter length are convolved in a few large blocks
+OVERLAP_ADD_MAX_RATIO = 8
+
+METHODS = ("direct", "overlap_add", "overlap_save")
+
+
+def choose_method(numtaps, nsamples, streaming=False):
+    """Return the cheapest way to apply numtaps FIR taps to nsamples samples.
+
+    Short filters and signals run as a direct convolution. A signal a few times longer
+    than the filter runs as an overlap-add FFT convolution, and longer ones, or signals
+    arriving in chunks, as overlap-save with blocks of four times the filter.
+    """
+    if numtaps <= DIRECT_MAX_TAPS or (not streaming and nsamples <= DIRECT_MAX_SAMPLES):
+        return "direct"
+    if not streaming and nsamples <= OVERLAP_ADD_MAX_RATIO * numtaps:
+        return "overlap_add"
+    return "overlap_save"
+
+
+def fir_convolve(taps, signal, method="auto"):
+    """Filter signal along its first axis with FIR taps, as lfilter(taps, 1.0, signal)."""
+    taps = np.asarray(taps, dtype=float)
+    signal = np.asarray(signal, dtype=float)
+    if method == "auto":
+        method = choose_method(len(taps), len(signal))
+    if method == "direct":
+        return lfilter(taps, 1.0, signal, axis=0)
+    elif method == "overlap_add":
+        kernel = taps.reshape((-1,) + (1,) * (signal.ndim - 1))
+        return oaconvolve(signal, kernel, axes=0)[: len(signal)]
+    elif method == "overlap_save":
+        return OverlapSave(taps).process(signal)
+    raise ValueError(
+        "Invalid method %r, expected auto or one of %s" % (method, METHODS)
+    )
+
+
+class OverlapSave:
+    """An FFT convolution keeping the end of the signal between chunks.
+
+    Every FFT block of nfft samples gives nfft - numtaps + 1 output samples. The block
+    size defaults to four times the filter, chunks may have any length.
+    """
+
+    def __init__(self, taps, block_size=None):
+        """Initialize the convolution from FIR taps."""
+        self.numtaps = len(taps)
+        self.nfft = next_fast_len(block_size or 4 * self.numtaps)
+        if self.nfft < self.numtaps:
+            raise ValueError("block_size must be at least the number of taps")
+        self.step = self.nfft - self.numtaps + 1
+        self.spectrum = rfft(np.asarray(taps, dtype=float), self.nfft)
+        self.history = None
+
+    def reset(self):
+        """Forget the end of the previous chunk, the next chunk starts a new signal."""
+        self.history = None
+
+    def process(self, chunk):
+        """Filter the next chunk of the signal along its first axis."""
+        chunk = np.asarray(chunk, dtype=float)
+        if self.history is None:
+            self.history = np.zeros((self.numtaps - 1,) + chunk.shape[1:])
+        n = len(chunk)
+        n_blocks = -(-n // self.step)
+        padded = np.zeros(((n_blocks - 1) * self.step + self.nfft,) + chunk.shape[1:])
+        padded[: len(self.history)] = self.history
+        padded[len(self.history) : len(self.history) + n] = chunk
+        self.history = padded[n : n + self.numtaps - 1].copy()
+        if not n:
+            return chunk
+
+        blocks = np.lib.stride_tricks.sliding_window_view(padded, self.nfft, axis=0)
+        blocks = blocks[:: self.step]  # (n_blocks, *channels, nfft)
+        spectrum = self.spectrum.reshape((1,) * (blocks.ndim - 1) + (-1,))
+        out = irfft(rfft(blocks, axis=-1) * spectrum, self.nfft, axis=-1)
+        out = np.moveaxis(out[..., self.numtaps - 1 :], -1, 1)
+        return out.reshape((-1,) + chunk.shape[1:])[:n]
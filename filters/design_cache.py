@@ -0,0 +1,127 @@
+"""This module contains a bounded cache of filter designs."""
+
+import threading
+from collections import OrderedDict
+
+import numpy as np
+from scipy.signal import firwin, iirfilter, kaiserord
+
+
+class DesignCache:
+    """A least recently used cache of filter coefficients, bounded in bytes.
+
+    Designs are keyed by every parameter that defines them, sample rate included, and
+    their arrays are returned read-only since all the callers share them.
+    """
+
+    def __init__(self, max_bytes=32 * 2**20):
+        """Initialize an empty cache holding at most max_bytes of coefficients."""
+        self.max_bytes = max_bytes
+        self.nbytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._designs = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, design):
+        """Return the design of key, calling design() to create it when missing."""
+        with self._lock:
+            if key in self._designs:
+                self._designs.move_to_end(key)
+                self.hits += 1
+                return self._designs[key][0]
+            self.misses += 1
+
+        value = _read_only(design())
+        size = (
+            sum(a.nbytes for a in value) if isinstance(value, tuple) else value.nbytes
+        )
+        with self._lock:
+            if key not in self._designs:
+                self._designs[key] = (value, size)
+                self.nbytes += size
+            while self.nbytes > self.max_bytes and len(self._designs) > 1:
+                _, (_, evicted) = self._designs.popitem(last=False)
+                self.nbytes -= evicted
+                self.evictions += 1
+        return value
+
+    def clear(self):
+        """Remove every design, keeping the statistics."""
+        with self._lock:
+            self._designs.clear()
+            self.nbytes = 0
+
+    def stats(self):
+        """Return the hit and miss counts and the size of the cache."""
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "entries": len(self._designs),
+            "nbytes": self.nbytes,
+            "max_bytes": self.max_bytes,
+        }
+
+
+DESIGN_CACHE = DesignCache()
+
+
+def iir_design(
+    order, cutoff_freqs, fs, btype="low", ftype="butter", rp=None, rs=None, output="ba"
+):
+    """Design an IIR filter with scipy's iirfilter, or return the cached design."""
+    cutoff = tuple(float(f) for f in np.atleast_1d(cutoff_freqs))
+    key = ("iir", int(order), cutoff, float(fs), btype, ftype, rp, rs, output)
+    return DESIGN_CACHE.get(
+        key,
+        lambda: iirfilter(
+            N=order,
+            Wn=cutoff[0] if len(cutoff) == 1 else cutoff,
+            fs=fs,
+            btype=btype,
+            ftype=ftype,
+            rp=rp,
+            rs=rs,
+            output=output,
+        ),
+    )
+
+
+def kaiser_fir_design(cutoff_freqs, fs, ripple_db, width_hz, pass_zero=True):
+    """Design a Kaiser window FIR filter, or return the cached taps.
+
+    The number of taps is the one kaiserord needs for ripple_db of attenuation and a
+    transition of width_hz.
+    """
+    cutoff = tuple(float(f) for f in np.atleast_1d(cutoff_freqs))
+    key = (
+        "kaiser_fir",
+        cutoff,
+        float(fs),
+        float(ripple_db),
+        float(width_hz),
+        pass_zero,
+    )
+
+    def design():
+        numtaps, beta = kaiserord(ripple_db, width_hz / (0.5 * fs))
+        return firwin(
+            numtaps,
+            cutoff[0] if len(cutoff) == 1 else cutoff,
+            window=("kaiser", beta),
+            pass_zero=pass_zero,
+            fs=fs,
+        )
+
+    return DESIGN_CACHE.get(key, design)
+
+
+def _read_only(value):
+    """Return the arrays of a design as read-only arrays."""
+    if isinstance(value, tuple):
+        return tuple(_read_only(a) for a in value)
+    value = np.asarray(value)
+    value.setflags(write=False)
+    return value
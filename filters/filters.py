@@ -1,49 +1,46 @@
 """This module contains functions to apply filters to signals."""
 
-from scipy.fft import fft, fftfreq
-from scipy.fftpack import fftshift
-from scipy.signal import filtfilt, firwin, iirfilter, kaiserord, lfilter
+from convolution import fir_convolve
+from design_cache import iir_design, kaiser_fir_design
+from scipy.signal import sosfiltfilt
+from spectrum import spectrum
+from streaming import StreamingFilter
 
 
-def fourier_transform(signal, sample_rate=44100, duration=5):
-    """Compute the Fourier Transform of a signal."""
-    # Number of samples in normalized_tone
-    N = sample_rate * duration
-    yf = fft(signal)
-    xf = fftfreq(N, 1 / sample_rate)
+def fourier_transform(signal, sample_rate=44100, duration=None):
+    """Compute the one-sided magnitude spectrum of a signal.
 
-    # Ordered FFT
-    yf = fftshift(yf)
-    xf = fftshift(xf)
-    return xf, yf
+    The frequency axis follows the length of the signal, duration is not used.
+    """
+    return spectrum(signal, sample_rate)
 
 
 def iir_filter(signal, f_cutofff, f_sampling, fbf=False):
-    """Apply an IIR filter to a signal."""
-    b, a = iirfilter(4, Wn=f_cutofff, fs=f_sampling, btype="low", ftype="butter")
+    """Apply an IIR filter to a signal, or to the (samples, channels) columns of one."""
+    sos = iir_design(4, f_cutofff, f_sampling, btype="low", output="sos")
     if not fbf:
-        filtered = lfilter(b, a, signal)
+        filtered = StreamingFilter(sos=sos).process(signal)
     else:
-        filtered = filtfilt(b, a, signal)
+        # sosfiltfilt needs writable sections, cached designs are read-only
+        filtered = sosfiltfilt(sos.copy(), signal, axis=0)
     return filtered
 
 
 def fir_filter(signal, nyq_rate, cuotff_hz):
-    """Apply a FIR filter to a signal."""
+    """Apply a FIR filter to a signal, or to the (samples, channels) columns of one."""
     # ----------------------------------------------------------------
     # Create a FIR filter and apply it to x.
     # ----------------------------------------------------------------
-    # The desired with of the transition from pass to stop,
-    # relative to the Nyquist rate. We'll design the filter
-    # with a 5 Hz transition width.
-    width = 5.0 / nyq_rate
+    # The desired with of the transition from pass to stop.
+    # We'll design the filter with a 5 Hz transition width.
+    width_hz = 5.0
     # The desired attenuation in the stop band, in dB.
     ripple_db = 20.0
-    # Compute the order and Kaiser parameter for the FIR filter.
-    N, beta = kaiserord(ripple_db, width)
-    # Use firwin with a Kaiser window to create a lowpass FIR filter.
-    taps = firwin(N, cuotff_hz / nyq_rate, window=("kaiser", beta))
-    # Use lfilter to filter x with the FIR filter.
-    filtered_x = lfilter(taps, 1.0, signal)
+    # Use firwin with a Kaiser window to create a lowpass FIR filter,
+    # kaiserord gives its order. Designs are cached.
+    taps = kaiser_fir_design(cuotff_hz, 2 * nyq_rate, ripple_db, width_hz)
+    N = len(taps)
+    # Filter x with the FIR filter, as an FFT convolution when it is long.
+    filtered_x = fir_convolve(taps, signal)
 
     return filtered_x, taps, N
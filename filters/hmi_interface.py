@@ -2,7 +2,6 @@
 
 import sys
 
-import numpy as np
 from hmi_processing import AudioSignal
 from matplotlib import gridspec
 from matplotlib.backends.backend_qt5agg import FigureCanvasQTAgg as FigureCanvas
@@ -116,7 +115,7 @@ class AudioUploader(QMainWindow):
 
         # Plot Fourier Transform of original signal
         freq, ft = self.audio.fourier_transform("original")
-        self.ax.plot(freq, np.abs(ft))
+        self.ax.plot(freq, ft)
         self.ax.grid()
         self.ax.set_xlabel("Frequency [Hz]")
         self.ax.set_ylabel("Amplitude")
@@ -306,9 +305,7 @@ class AudioUploader(QMainWindow):
         self.ax1.set_ylabel("Amplitude")
 
         freq, ft = self.audio.fourier_transform("processed")
-        freq = freq[: len(freq) // 2]
-        ft = ft[: len(ft) // 2]
-        self.ax2.plot(freq, np.abs(ft))
+        self.ax2.plot(freq, ft)
         self.ax2.grid()
         self.ax2.set_xlabel("Frequency [Hz]")
         self.ax2.set_ylabel("Amplitude")
@@ -3,14 +3,21 @@
 from pathlib import Path
 
 import numpy as np
+from convolution import fir_convolve
+from design_cache import iir_design, kaiser_fir_design
 from pydub import AudioSegment
-from scipy.fft import fft
 from scipy.io import wavfile
-from scipy.signal import filtfilt, firwin, iirfilter, kaiserord, lfilter
+from scipy.signal import sosfiltfilt
+from spectrum import spectrum
+from streaming import StreamingFilter
 
 
 class AudioSignal:
-    """A class that represent the audio signal to be manipulated."""
+    """A class that represent the audio signal to be manipulated.
+
+    Every channel is kept, signals are (samples, channels) arrays, and filtering, Fourier
+    transforms and saving process all the channels at once.
+    """
 
     def __init__(self, filepath):
         """Initialize the AudioSignal object."""
@@ -18,24 +25,57 @@ class AudioSignal:
 
         # check extension
         if self.file.endswith(".wav"):
-            self.sampFreq, self.signal = wavfile.read(self.file)
+            sampFreq, signal = wavfile.read(self.file)
         elif self.file.endswith(".mp3"):
             temp = AudioSegment.from_mp3(self.file)
-            self.signal = np.array(temp.get_array_of_samples())
-            self.sampFreq = temp.frame_rate
+            signal = np.array(temp.get_array_of_samples())
+            signal = signal.reshape(-1, temp.channels)  # samples are interleaved
+            sampFreq = temp.frame_rate
         elif self.file.endswith(".aac"):
             temp = AudioSegment.from_file(self.file, format="aac")
-            self.signal = np.array(temp.get_array_of_samples())
-            self.sampFreq = temp.frame_rate
+            signal = np.array(temp.get_array_of_samples())
+            signal = signal.reshape(-1, temp.channels)  # samples are interleaved
+            sampFreq = temp.frame_rate
         else:
             print("Invalid file format")
             return
-        # if stereo, convert to mono
-        if len(self.signal.shape) > 1 and self.signal.shape[1] > 1:
-            self.signal = self.signal[:, 0]  # only one channel
-
+        self.set_signal(signal, sampFreq)
+
+    @classmethod
+    def from_array(cls, signal, sampFreq, file=None):
+        """Create an AudioSignal from (samples,) or (samples, channels) 16-bit samples."""
+        audio = cls.__new__(cls)
+        audio.file = file
+        audio.set_signal(np.asarray(signal), sampFreq)
+        return audio
+
+    @classmethod
+    def stack(cls, signals):
+        """Stack the channels of AudioSignals with the same rate into one AudioSignal.
+
+        Shorter signals are padded with silence, so a batch of files is processed as
+        the channels of a single signal.
+        """
+        rates = {s.sampFreq for s in signals}
+        if len(rates) != 1:
+            raise ValueError("Signals have different sample rates: %s" % sorted(rates))
+        n_samples = max(s.nSamples for s in signals)
+        stacked = np.zeros(
+            (n_samples, sum(s.nChannels for s in signals)),
+            dtype=np.result_type(*[s.signal for s in signals]),
+        )
+        column = 0
+        for s in signals:
+            stacked[: s.nSamples, column : column + s.nChannels] = s.signal
+            column += s.nChannels
+        return cls.from_array(stacked, rates.pop())
+
+    def set_signal(self, signal, sampFreq):
+        """Replace the signal by (samples,) or (samples, channels) 16-bit samples."""
+        self.sampFreq = sampFreq
+        self.signal = signal.reshape(len(signal), -1)
         self.normSignal = self.signal / 2.0**15
-        self.nSamples = self.signal.shape[0]
+        self.nSamples, self.nChannels = self.signal.shape
         self.duration = self.nSamples / self.sampFreq
         self.processedSignal = np.zeros(self.signal.shape)
 
@@ -51,42 +91,45 @@ class AudioSignal:
             return
 
     def generate_filter(
-        self, filter_type, band_type, cutoff_freqs, order=4, ftype="butter", rp=1, rs=40
+        self,
+        filter_type,
+        band_type,
+        cutoff_freqs,
+        order=4,
+        ftype="butter",
+        rp=1,
+        rs=40,
+        output="ba",
     ):
-        """Generate a filter to be applied to the audio signal."""
+        """Generate a filter to be applied to the audio signal.
+
+        IIR filters are returned as (b, a), or as second-order sections with output="sos".
+        Designs come from the shared design cache, their arrays are read-only.
+        """
         if filter_type == "iir":
             if ftype == "butter" or ftype == "bessel":
-                b, a = iirfilter(
-                    N=order,
-                    Wn=cutoff_freqs,
-                    fs=self.sampFreq,
-                    btype=band_type,
-                    ftype=ftype,
-                )
-            else:
-                b, a = iirfilter(
-                    N=order,
-                    Wn=cutoff_freqs,
-                    fs=self.sampFreq,
-                    btype=band_type,
-                    ftype=ftype,
-                    rp=rp,
-                    rs=rs,
-                )
-            return b, a
+                rp = rs = None
+            return iir_design(
+                order,
+                cutoff_freqs,
+                self.sampFreq,
+                btype=band_type,
+                ftype=ftype,
+                rp=rp,
+                rs=rs,
+                output=output,
+            )
 
         elif filter_type == "fir":
             attenuation_db = 65
-            transition_width = 24 / (self.sampFreq * 0.5)
-            N, beta = kaiserord(ripple=attenuation_db, width=transition_width)
-            coeffs = firwin(
-                numtaps=N,
-                cutoff=cutoff_freqs,
-                window=("kaiser", beta),
+            transition_width_hz = 24
+            return kaiser_fir_design(
+                cutoff_freqs,
+                self.sampFreq,
+                attenuation_db,
+                transition_width_hz,
                 pass_zero=band_type,
-                fs=self.sampFreq,
             )
-            return coeffs
         else:
             print("Invalid filter type")
             return
@@ -96,21 +139,38 @@ class AudioSignal:
     ):
         """Apply a filter to the audio signal."""
         if filter_type == "iir":
-            b, a = self.generate_filter(
-                filter_type, band_type, cutoff_freqs, order, ftype
+            sos = self.generate_filter(
+                filter_type, band_type, cutoff_freqs, order, ftype, output="sos"
             )
-            self.processedSignal = filtfilt(b, a, self.normSignal)
+            # sosfiltfilt needs writable sections, cached designs are read-only
+            self.processedSignal = sosfiltfilt(sos.copy(), self.normSignal, axis=0)
 
         elif filter_type == "fir":
             coeffs = self.generate_filter(filter_type, band_type, cutoff_freqs)
-            self.processedSignal = lfilter(coeffs, 1.0, self.normSignal)
+            self.processedSignal = fir_convolve(coeffs, self.normSignal)
 
         else:
             print("Invalid filter type")
             return
 
+    def streaming_filter(
+        self, filter_type, band_type, cutoff_freqs, order=4, ftype="butter"
+    ):
+        """Return a filter that processes signals at this sample rate chunk by chunk."""
+        if filter_type == "iir":
+            sos = self.generate_filter(
+                filter_type, band_type, cutoff_freqs, order, ftype, output="sos"
+            )
+            return StreamingFilter(sos=sos)
+        elif filter_type == "fir":
+            taps = self.generate_filter(filter_type, band_type, cutoff_freqs)
+            return StreamingFilter(taps=taps)
+        else:
+            print("Invalid filter type")
+            return
+
     def fourier_transform(self, sig):
-        """Compute the Fourier Transform of a signal."""
+        """Compute the one-sided magnitude spectrum of a signal, for every channel."""
         if sig == "original":
             signal = self.normSignal
         elif sig == "processed":
@@ -119,14 +179,13 @@ class AudioSignal:
             print("Invalid signal type")
             return
 
-        ft = fft(signal)
-        freq = np.linspace(0, self.sampFreq, len(ft))
-        # freq = fftfreq(len(ft), 1/self.sampFreq)
-        # ft = fftshift(ft)
-        return freq[: len(freq) // 2], ft[: len(ft) // 2]
+        return spectrum(signal, self.sampFreq)
 
     def save_signal(self, file_path, file_name, format):
-        """Save the processed signal to a file."""
+        """Save the processed signal to a file, with all its channels.
+
+        The channels are normalized together, which keeps their relative levels.
+        """
         # add file extension
         file_name = file_name + format
         path = Path(file_path) / file_name
@@ -137,12 +196,19 @@ class AudioSignal:
         if format == ".wav":
             wavfile.write(str(path), self.sampFreq, data)
         elif format == ".mp3":
+            # the rows of a C-ordered array are the interleaved frames pydub expects
             song = AudioSegment(
-                data.tobytes(), frame_rate=self.sampFreq, sample_width=2, channels=1
+                data.tobytes(),
+                frame_rate=self.sampFreq,
+                sample_width=2,
+                channels=self.nChannels,
             )
             song.export(path, format="mp3")
         elif format == ".aac":
             song = AudioSegment(
-                data.tobytes(), frame_rate=self.sampFreq, sample_width=2, channels=1
+                data.tobytes(),
+                frame_rate=self.sampFreq,
+                sample_width=2,
+                channels=self.nChannels,
             )
             song.export(path, format="adts")
@@ -36,9 +36,9 @@ def filter():
     plt.show()
 
     # Signal Fourier Trnasform before filtering
-    xf, yf = fourier_transform(x_noise, sample_rate=fs, duration=5)
+    xf, yf = fourier_transform(x_noise, sample_rate=fs)
     plt.figure(figsize=[12, 5])
-    plt.plot(xf, np.abs(yf))
+    plt.plot(xf, yf)
     plt.show()
 
     # Define low-pass filter with 10 Hz cutoff frequency
@@ -46,9 +46,9 @@ def filter():
     x_filtered = iir_filter(x_noise, fc, fs)
 
     # signal Fourier Transform after filtering
-    xf, yf = fourier_transform(x_filtered, sample_rate=fs, duration=5)
+    xf, yf = fourier_transform(x_filtered, sample_rate=fs)
     plt.figure(figsize=[12, 5])
-    plt.plot(xf, np.abs(yf))
+    plt.plot(xf, yf)
     plt.show()
 
     plt.figure(figsize=[12, 5])
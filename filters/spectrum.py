@@ -0,0 +1,44 @@
+"""This module contains the one-sided spectrum of real signals."""
+
+from functools import lru_cache
+
+import numpy as np
+from scipy.fft import next_fast_len, rfft, rfftfreq
+
+
+@lru_cache(maxsize=64)
+def frequency_axis(nfft, sample_rate):
+    """Return the read-only frequencies of the rfft bins of nfft samples."""
+    freq = rfftfreq(nfft, 1.0 / sample_rate)
+    freq.setflags(write=False)
+    return freq
+
+
+def spectrum(
+    signal, sample_rate, scaling="magnitude", pad=True, workers=-1, single=False
+):
+    """Compute the one-sided spectrum of a real signal along its first axis.
+
+    The magnitude scaling gives the amplitude of a sinusoid at its frequency, the psd
+    scaling the power spectral density in units**2/Hz. With pad, the signal is zero
+    padded to the next length that FFTs fast, which refines the frequency axis but keeps
+    the scale. The transform runs on workers threads, all cores by default, and in
+    single precision with single.
+
+    Returns the frequencies and the (frequencies,) or (frequencies, channels) spectrum.
+    """
+    signal = np.asarray(signal, dtype=np.float32 if single else float)
+    n = len(signal)
+    nfft = next_fast_len(n, real=True) if pad else n
+    ft = rfft(signal, nfft, axis=0, workers=workers)
+
+    if scaling == "magnitude":
+        values = np.abs(ft) / n
+    elif scaling == "psd":
+        values = (ft.real**2 + ft.imag**2) / (sample_rate * n)
+    else:
+        raise ValueError("Invalid scaling %r, expected magnitude or psd" % scaling)
+    # fold the negative frequencies, which DC and Nyquist do not have
+    last = None if nfft % 2 else -1
+    values[1:last] *= 2
+    return frequency_axis(nfft, sample_rate), values
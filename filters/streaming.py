@@ -0,0 +1,92 @@
+"""This module contains a filter that processes a signal chunk by chunk."""
+
+import wave
+
+import numpy as np
+from convolution import OverlapSave, choose_method
+from scipy.io import wavfile
+from scipy.signal import lfilter, sosfilt
+
+
+class StreamingFilter:
+    """A filter that keeps its state between the chunks of a signal.
+
+    IIR filters run as second-order sections, FIR filters as their taps. Chunks are
+    filtered along their first axis, so (samples,) and (samples, channels) chunks both
+    work. Filtering a signal chunk by chunk gives the same output as filtering it at once.
+
+    FIR filters with many taps run as an overlap-save FFT convolution, see
+    :func:`convolution.choose_method`, with FFT blocks of block_size samples.
+    """
+
+    def __init__(self, sos=None, taps=None, method="auto", block_size=None):
+        """Initialize the filter from IIR sections or FIR taps."""
+        if (sos is None) == (taps is None):
+            raise ValueError("Give either sos or taps")
+        # sosfilt needs writable sections, designs may be shared read-only arrays
+        self.sos = None if sos is None else np.array(sos, dtype=float, ndmin=2)
+        self.taps = None if taps is None else np.asarray(taps, dtype=float)
+        self.zi = None
+        self.convolution = None
+        if taps is not None:
+            if method == "auto":
+                method = choose_method(len(self.taps), 0, streaming=True)
+            if method == "overlap_save":
+                self.convolution = OverlapSave(self.taps, block_size)
+
+    def reset(self):
+        """Forget the filter state, the next chunk starts a new signal."""
+        self.zi = None
+        if self.convolution is not None:
+            self.convolution.reset()
+
+    def process(self, chunk):
+        """Filter the next chunk of the signal."""
+        if self.convolution is not None:
+            return self.convolution.process(chunk)
+        chunk = np.asarray(chunk, dtype=float)
+        if self.zi is None:
+            self.zi = self._initial_state(chunk.shape[1:])
+        if self.sos is not None:
+            out, self.zi = sosfilt(self.sos, chunk, axis=0, zi=self.zi)
+        elif len(self.taps) > 1:
+            out, self.zi = lfilter(self.taps, 1.0, chunk, axis=0, zi=self.zi)
+        else:
+            out = chunk * self.taps[0]
+        return out
+
+    def process_blocks(self, blocks):
+        """Filter an iterable of chunks, yielding the filtered chunks."""
+        for block in blocks:
+            yield self.process(block)
+
+    def _initial_state(self, channel_shape):
+        """Return a zero state for chunks with the given shape after the first axis."""
+        if self.sos is not None:
+            return np.zeros((len(self.sos), 2) + channel_shape)
+        return np.zeros((max(len(self.taps) - 1, 0),) + channel_shape)
+
+
+def filter_wav(src, dst, stream_filter, block_size=65536):
+    """Filter a wav file into a 16-bit wav file, holding one block in memory.
+
+    Integer samples are scaled to [-1, 1] by their full scale and the output is clipped
+    to it, as a streamed signal cannot be normalized by its maximum.
+    """
+    rate, samples = wavfile.read(src, mmap=True)
+    offset, scale = 0.0, 1.0
+    if samples.dtype == np.uint8:
+        offset, scale = 128.0, 1.0 / 128
+    elif np.issubdtype(samples.dtype, np.integer):
+        scale = 1.0 / (np.iinfo(samples.dtype).max + 1.0)
+    channels = 1 if samples.ndim == 1 else samples.shape[1]
+
+    stream_filter.reset()
+    with wave.open(str(dst), "wb") as out:
+        out.setnchannels(channels)
+        out.setsampwidth(2)
+        out.setframerate(rate)
+        for start in range(0, len(samples), block_size):
+            block = (samples[start : start + block_size] - offset) * scale
+            filtered = np.clip(stream_filter.process(block), -1.0, 1.0)
+            out.writeframes((filtered * 32767).astype("<i2").tobytes())
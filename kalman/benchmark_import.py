@@ -0,0 +1,106 @@
+"""Cold-start import benchmark of the tracker modules."""
+
+import argparse
+import json
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+HEAVY_MODULES = ["matplotlib", "skimage", "filterpy", "scipy.stats", "torch"]
+
+# what importing sort.py used to pull in before the display dependencies became lazy
+PREVIOUS_SORT_IMPORTS = (
+    "import matplotlib; import matplotlib.patches; import matplotlib.pyplot; "
+    "import numpy; from filterpy.kalman import KalmanFilter; from skimage import io"
+)
+
+# a tracker only pays for its filter once it creates a track, time that too
+FIRST_UPDATE = (
+    "import numpy, sort; sort.%s().update(numpy.array([[0, 0, 10, 10, 1.0]]))"
+)
+
+PROBE = (
+    "import sys, time; start = time.perf_counter(); %s; "
+    "print(time.perf_counter() - start); print(','.join(m for m in %r if m in sys.modules))"
+)
+
+
+def cold_import(statement, cwd):
+    """Runs statement in a fresh interpreter, returns (seconds, heavy modules loaded)."""
+    output = subprocess.run(
+        [sys.executable, "-c", PROBE % (statement, HEAVY_MODULES)],
+        cwd=cwd,
+        check=True,
+        capture_output=True,
+        text=True,
+    ).stdout.split("\n")
+    return float(output[0]), [m for m in output[1].split(",") if m]
+
+
+def bench(name, statement, repeats, cwd):
+    """Times repeats cold imports of statement."""
+    seconds = []
+    for _ in range(repeats):
+        elapsed, loaded = cold_import(statement, cwd)
+        seconds.append(elapsed)
+    ms = np.asarray(seconds) * 1000.0
+    result = {
+        "name": name,
+        "p50_ms": float(np.percentile(ms, 50)),
+        "min_ms": float(ms.min()),
+        "heavy_modules": loaded,
+    }
+    print(
+        "%-24s p50 %9.1f ms  min %9.1f ms  loads: %s"
+        % (name, result["p50_ms"], result["min_ms"], ", ".join(loaded) or "-")
+    )
+    return result
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description="Tracker import-time benchmark")
+    parser.add_argument(
+        "--repeats", help="Fresh interpreters per measurement [5]", type=int, default=5
+    )
+    parser.add_argument(
+        "--output", help="Write the results as JSON to this file", type=str
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    cwd = os.path.dirname(os.path.abspath(__file__))
+    results = [
+        bench("numpy (floor)", "import numpy", args.repeats, cwd),
+        bench("sort", "import sort", args.repeats, cwd),
+        bench("multi_stream", "import multi_stream", args.repeats, cwd),
+        bench("previous sort imports", PREVIOUS_SORT_IMPORTS, args.repeats, cwd),
+        bench("Sort first update", FIRST_UPDATE % "Sort", args.repeats, cwd),
+        bench("BatchSort first update", FIRST_UPDATE % "BatchSort", args.repeats, cwd),
+    ]
+    print(
+        "Importing sort is %.1fx faster than its previous dependencies"
+        % (results[3]["p50_ms"] / results[1]["p50_ms"])
+    )
+    print(
+        "Up to the first tracks, Sort is %.1fx and BatchSort %.1fx faster than them"
+        % (
+            results[3]["p50_ms"] / results[4]["p50_ms"],
+            results[3]["p50_ms"] / results[5]["p50_ms"],
+        )
+    )
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(
+                {
+                    "meta": {"time": time.strftime("%Y-%m-%dT%H:%M:%S")},
+                    "results": results,
+                },
+                f,
+                indent=2,
+            )
@@ -0,0 +1,393 @@
+"""Scaling benchmark of the SORT tracker on synthetic scenes."""
+
+import argparse
+import json
+import platform
+import time
+import tracemalloc
+
+import numpy as np
+from sort import (
+    ASSIGNMENT_SOLVERS,
+    BatchSort,
+    KalmanBoxBank,
+    KalmanBoxTracker,
+    Sort,
+    associate_detections_to_trackers,
+    associate_detections_to_trackers_gated,
+    hungarian_assignment,
+    iou_batch,
+    overlapping_pairs,
+)
+
+TRACKERS = {
+    "sort": lambda: Sort(max_age=5, min_hits=3),
+    "sort_gated": lambda: Sort(max_age=5, min_hits=3, gated=True),
+    "batch": lambda: BatchSort(max_age=5, min_hits=3),
+    "batch_gated": lambda: BatchSort(max_age=5, min_hits=3, gated=True),
+    "batch_greedy": lambda: BatchSort(max_age=5, min_hits=3, assignment="greedy"),
+    "batch_auction": lambda: BatchSort(max_age=5, min_hits=3, assignment="auction"),
+    "batch_gated_greedy": lambda: BatchSort(
+        max_age=5, min_hits=3, gated=True, assignment="greedy"
+    ),
+    "batch_gated_auction": lambda: BatchSort(
+        max_age=5, min_hits=3, gated=True, assignment="auction"
+    ),
+}
+
+
+def synthetic_scene(
+    n_objects,
+    n_frames,
+    seed=0,
+    area_per_object=40000.0,
+    turnover=0.01,
+    occlusion_rate=0.02,
+    occlusion_length=5,
+    noise=2.0,
+):
+    """Generates the per-frame (N,5) [x1,y1,x2,y2,score] detections of a synthetic scene.
+
+    About n_objects boxes move with constant velocity in a square sized so that each one has
+    area_per_object pixels of room. Every frame a turnover fraction of them dies and as many
+    are born, an occlusion_rate fraction starts an occlusion of up to occlusion_length frames
+    without detections, and detected corners get gaussian noise of noise pixels.
+    """
+    rng = np.random.default_rng(seed)
+    side = np.sqrt(n_objects * area_per_object)
+
+    def spawn(n):
+        wh = rng.uniform(20.0, 80.0, (n, 2)) * [1.0, 2.0]
+        return rng.uniform(0.0, side, (n, 2)), rng.normal(0.0, 3.0, (n, 2)), wh
+
+    pos, vel, wh = spawn(n_objects)
+    occluded = np.zeros(n_objects, dtype=int)
+    frames = []
+    for _ in range(n_frames):
+        dead = rng.random(len(pos)) < turnover
+        born = spawn(int(dead.sum()))
+        pos = np.concatenate((pos[~dead], born[0]))
+        vel = np.concatenate((vel[~dead], born[1]))
+        wh = np.concatenate((wh[~dead], born[2]))
+        occluded = np.concatenate((occluded[~dead], np.zeros(len(born[0]), dtype=int)))
+
+        pos += vel
+        occluded = np.maximum(occluded - 1, 0)
+        starts = (occluded == 0) & (rng.random(len(pos)) < occlusion_rate)
+        occluded[starts] = rng.integers(1, occlusion_length + 1, int(starts.sum()))
+
+        visible = occluded == 0
+        boxes = np.concatenate((pos, pos + wh), axis=1)[visible]
+        boxes += rng.normal(0.0, noise, boxes.shape)
+        scores = rng.uniform(0.5, 1.0, (len(boxes), 1))
+        frames.append(np.concatenate((boxes, scores), axis=1))
+    return frames
+
+
+def latency_stats(seconds):
+    """Summarises a list of durations in milliseconds."""
+    ms = np.asarray(seconds) * 1000.0
+    return {
+        "mean_ms": float(ms.mean()),
+        "p50_ms": float(np.percentile(ms, 50)),
+        "p95_ms": float(np.percentile(ms, 95)),
+        "p99_ms": float(np.percentile(ms, 99)),
+    }
+
+
+def time_calls(func, repeats):
+    """Times repeats calls of func."""
+    seconds = []
+    for _ in range(repeats):
+        start = time.perf_counter()
+        func()
+        seconds.append(time.perf_counter() - start)
+    return seconds
+
+
+def bench_update(tracker_name, frames):
+    """Measures the per-frame latency and peak memory of ``update`` over frames."""
+    tracker = TRACKERS[tracker_name]()
+    seconds = []
+    for dets in frames:
+        start = time.perf_counter()
+        tracker.update(dets)
+        seconds.append(time.perf_counter() - start)
+
+    # memory is traced on a second run so that tracing does not skew the latencies
+    tracker = TRACKERS[tracker_name]()
+    tracemalloc.start()
+    for dets in frames:
+        tracker.update(dets)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    result = {"name": "update", "variant": tracker_name}
+    result.update(latency_stats(seconds))
+    result["peak_mem_mb"] = peak / 2.0**20
+    return result
+
+
+def check_gated_pairs(dets, trks):
+    """Raises RuntimeError unless overlapping_pairs finds the pairs of ``iou_batch > 0``.
+
+    The check is repeated with a tracker box covering the whole scene appended, which is
+    swept apart from the others, and with the boxes split into groups.
+    """
+    huge = np.concatenate((dets[:, 0:2].min(0) - 1.0, dets[:, 2:4].max(0) + 1.0, [0.0]))
+    trks = np.vstack((trks, huge))
+    det_groups = np.arange(len(dets)) % 3
+    trk_groups = np.arange(len(trks)) % 3
+    for n_trks, groups in (
+        (len(trks) - 1, False),
+        (len(trks), False),
+        (len(trks), True),
+    ):
+        overlap = iou_batch(dets, trks[:n_trks]) > 0
+        if groups:
+            overlap &= det_groups[:, None] == trk_groups[None, :n_trks]
+            pairs = overlapping_pairs(
+                dets, trks[:n_trks], det_groups, trk_groups[:n_trks]
+            )
+        else:
+            pairs = overlapping_pairs(dets, trks[:n_trks])
+        found = sorted(zip(*(p.tolist() for p in pairs)))
+        if found != sorted(zip(*(p.tolist() for p in np.nonzero(overlap)))):
+            raise RuntimeError(
+                "overlapping_pairs differs from the dense IOU pairs (%d trackers%s)"
+                % (n_trks, ", grouped" if groups else "")
+            )
+
+
+def bench_components(frames, repeats, dense_limit, iou_threshold=0.3):
+    """Times iou_batch, the association functions and the Kalman steps on one frame.
+
+    Every assignment solver is also timed on the dense IOU matrix, and its accuracy against
+    the exact Hungarian solution is summed over every pair of consecutive frames: the ratio
+    of matched IOU, the fraction of the exact matches it reproduces and the number of frame
+    pairs whose matches differ. The pairs of the gated association are checked against the
+    dense ones with :func:`check_gated_pairs`.
+    """
+    dets, next_dets = frames[-2], frames[-1]
+    results = []
+
+    def add(name, variant, seconds):
+        result = {"name": name, "variant": variant}
+        result.update(latency_stats(seconds))
+        results.append(result)
+
+    if len(dets) <= dense_limit:
+        check_gated_pairs(next_dets, dets)
+        add(
+            "iou_batch",
+            "dense",
+            time_calls(lambda: iou_batch(next_dets, dets), repeats),
+        )
+        add(
+            "associate",
+            "dense",
+            time_calls(
+                lambda: associate_detections_to_trackers(next_dets, dets), repeats
+            ),
+        )
+
+        def matches(solver, iou_matrix):
+            pairs = solver(iou_matrix).reshape(-1, 2)
+            pairs = pairs[iou_matrix[pairs[:, 0], pairs[:, 1]] >= iou_threshold]
+            return (
+                set(map(tuple, pairs.tolist())),
+                iou_matrix[pairs[:, 0], pairs[:, 1]].sum(),
+            )
+
+        # matched IOU, exact matches reproduced and frame pairs differing, per solver
+        totals = {name: [0.0, 0, 0] for name in ASSIGNMENT_SOLVERS}
+        exact_iou, exact_count = 0.0, 0
+        for previous, current in zip(frames[:-1], frames[1:]):
+            iou_matrix = iou_batch(current, previous)
+            exact, iou = matches(hungarian_assignment, iou_matrix)
+            exact_iou += iou
+            exact_count += len(exact)
+            for name, solver in ASSIGNMENT_SOLVERS.items():
+                pairs, iou = matches(solver, iou_matrix)
+                totals[name][0] += iou
+                totals[name][1] += len(exact & pairs)
+                totals[name][2] += pairs != exact
+
+        iou_matrix = iou_batch(next_dets, dets)
+        for name, solver in sorted(ASSIGNMENT_SOLVERS.items()):
+            add("assignment", name, time_calls(lambda: solver(iou_matrix), repeats))
+            results[-1]["iou_ratio"] = float(totals[name][0] / max(exact_iou, 1e-12))
+            results[-1]["agreement"] = totals[name][1] / max(exact_count, 1)
+            results[-1]["differing_frames"] = totals[name][2]
+            results[-1]["frame_pairs"] = len(frames) - 1
+    add(
+        "associate",
+        "gated",
+        time_calls(
+            lambda: associate_detections_to_trackers_gated(next_dets, dets), repeats
+        ),
+    )
+
+    trackers = [KalmanBoxTracker(d) for d in dets]
+    add(
+        "kalman_predict",
+        "tracker",
+        time_calls(lambda: [t.predict() for t in trackers], repeats),
+    )
+    n = min(len(trackers), len(next_dets))
+    add(
+        "kalman_update",
+        "tracker",
+        time_calls(
+            lambda: [t.update(d) for t, d in zip(trackers, next_dets[:n])], repeats
+        ),
+    )
+
+    bank = KalmanBoxBank()
+    bank.add(dets[:, :4])
+    add("kalman_predict", "bank", time_calls(bank.predict, repeats))
+    idx = np.arange(n)
+    add(
+        "kalman_update",
+        "bank",
+        time_calls(lambda: bank.update(idx, next_dets[:n, :4]), repeats),
+    )
+    return results
+
+
+def run(args):
+    """Runs the benchmark for every object count and returns the results document."""
+    results = []
+    for n_objects in args.counts:
+        frames = synthetic_scene(
+            n_objects,
+            args.frames,
+            seed=args.seed,
+            area_per_object=args.area_per_object,
+        )
+        print("%d objects, %d frames" % (n_objects, args.frames))
+        scene_results = [
+            bench_update(tracker_name, frames)
+            for tracker_name in args.trackers
+            if "gated" in tracker_name or n_objects <= args.dense_limit
+        ]
+        scene_results.extend(bench_components(frames, args.repeats, args.dense_limit))
+        for result in scene_results:
+            result["objects"] = n_objects
+            print(
+                "  %-15s %-20s p50 %9.3f ms  p95 %9.3f ms  p99 %9.3f ms%s"
+                % (
+                    result["name"],
+                    result["variant"],
+                    result["p50_ms"],
+                    result["p95_ms"],
+                    result["p99_ms"],
+                    (
+                        "  iou %.4f  agreement %.4f  differ %d/%d"
+                        % (
+                            result["iou_ratio"],
+                            result["agreement"],
+                            result["differing_frames"],
+                            result["frame_pairs"],
+                        )
+                        if "iou_ratio" in result
+                        else ""
+                    ),
+                )
+            )
+        results.extend(scene_results)
+    return {
+        "meta": {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "python": platform.python_version(),
+            "numpy": np.__version__,
+            "machine": platform.machine(),
+            "frames": args.frames,
+            "seed": args.seed,
+            "area_per_object": args.area_per_object,
+        },
+        "results": results,
+    }
+
+
+def compare(document, baseline):
+    """Prints the p50 and p95 ratios of document against a baseline results document."""
+
+    def key(result):
+        return result["name"], result["variant"], result["objects"]
+
+    previous = {key(r): r for r in baseline["results"]}
+    print(
+        "\n%-15s %-20s %8s %10s %10s" % ("name", "variant", "objects", "p50 x", "p95 x")
+    )
+    for result in document["results"]:
+        old = previous.get(key(result))
+        if old is not None:
+            print(
+                "%-15s %-20s %8d %10.2f %10.2f"
+                % (
+                    result["name"],
+                    result["variant"],
+                    result["objects"],
+                    result["p50_ms"] / old["p50_ms"],
+                    result["p95_ms"] / old["p95_ms"],
+                )
+            )
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description="SORT scaling benchmark")
+    parser.add_argument(
+        "--counts",
+        help="Object counts of the synthetic scenes [10 100 1000 5000]",
+        type=int,
+        nargs="+",
+        default=[10, 100, 1000, 5000],
+    )
+    parser.add_argument(
+        "--trackers",
+        help="Tracker variants to benchmark [all]",
+        nargs="+",
+        choices=sorted(TRACKERS),
+        default=sorted(TRACKERS),
+    )
+    parser.add_argument(
+        "--frames", help="Frames per scene [100]", type=int, default=100
+    )
+    parser.add_argument(
+        "--area_per_object",
+        help="Scene area per object in square pixels, lower is more crowded [40000]",
+        type=float,
+        default=40000.0,
+    )
+    parser.add_argument(
+        "--repeats", help="Repeats of the component timings [20]", type=int, default=20
+    )
+    parser.add_argument(
+        "--dense_limit",
+        help="Largest object count run through the dense IOU/Hungarian path [1000]",
+        type=int,
+        default=1000,
+    )
+    parser.add_argument(
+        "--seed", help="Seed of the synthetic scenes [0]", type=int, default=0
+    )
+    parser.add_argument(
+        "--output", help="Write the results as JSON to this file", type=str
+    )
+    parser.add_argument(
+        "--compare", help="Results JSON of a previous run to compare against", type=str
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    document = run(args)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(document, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            compare(document, json.load(f))
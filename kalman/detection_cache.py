@@ -0,0 +1,131 @@
+"""Persistent per-frame person detections of recorded videos."""
+
+import hashlib
+import os
+
+import numpy as np
+
+DEFAULT_DET_CACHE_DIR = os.path.join(
+    os.path.expanduser("~"), ".cache", "sort_detections"
+)
+
+
+def video_digest(path, chunk_size=1 << 20):
+    """Returns the SHA-1 hex digest of the content of the video file."""
+    digest = hashlib.sha1()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(chunk_size), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class FrameDetections(object):
+    """Person detections of every frame of a video, frames numbered from 0.
+
+    The table holds the number of frames in row 0 and one [frame, x1, y1, x2, y2, score] row
+    per detection after it, sorted by frame, so that every frame is a view of the table.
+    """
+
+    def __init__(self, table):
+        """Indexes table, which may be memory-mapped."""
+        self.n_frames = int(table[0, 0])
+        self._dets = table[1:, 1:6]
+        self._offsets = np.searchsorted(table[1:, 0], np.arange(self.n_frames + 1))
+
+    def __len__(self):
+        """Number of frames of the video."""
+        return self.n_frames
+
+    def __getitem__(self, frame):
+        """Returns the (N,5) [x1,y1,x2,y2,score] float32 detections of frame."""
+        if frame < 0 or frame >= self.n_frames:
+            return self._dets[:0]
+        return self._dets[self._offsets[frame] : self._offsets[frame + 1]]
+
+    def __iter__(self):
+        """Yields the detections of every frame."""
+        for frame in range(self.n_frames):
+            yield self[frame]
+
+    @staticmethod
+    def table(per_frame):
+        """Builds the table of a list of per-frame (N,5) detections."""
+        counts = [len(d) for d in per_frame]
+        table = np.zeros((sum(counts) + 1, 6), dtype=np.float32)
+        table[0, 0] = len(per_frame)
+        if sum(counts):
+            table[1:, 0] = np.repeat(np.arange(len(per_frame)), counts)
+            table[1:, 1:6] = np.concatenate([d for d in per_frame if len(d)])
+        return table
+
+
+class DetectionCache(object):
+    """Directory of :class:`FrameDetections` files, one per video and detector settings.
+
+    A file is keyed by the content digest of the video and the model name, confidence
+    threshold and input size of the :class:`PersonDetector`, so renamed videos are still
+    found and any change of the settings runs the detector again. Files are ``.npy`` tables
+    memory-mapped when reused.
+    """
+
+    def __init__(self, cache_dir=DEFAULT_DET_CACHE_DIR):
+        """Uses cache_dir, created when the first file is written."""
+        self.cache_dir = cache_dir
+        self._digests = {}
+
+    def path(self, video, detector):
+        """Returns the cache file of video detected by detector."""
+        stat = os.stat(video)
+        stamp = (os.path.abspath(video), stat.st_size, stat.st_mtime)
+        if stamp not in self._digests:
+            self._digests[stamp] = video_digest(video)
+        key = "%s-%s-conf%g-%d" % (
+            self._digests[stamp],
+            detector.model_name,
+            detector.conf,
+            detector.img_size,
+        )
+        return os.path.join(self.cache_dir, key + ".npy")
+
+    def load(self, video, detector):
+        """Returns the cached detections, or None when they are not cached."""
+        try:
+            return FrameDetections(np.load(self.path(video, detector), mmap_mode="r"))
+        except (OSError, ValueError):
+            return None
+
+    def build(self, video, detector, batch_size=8):
+        """Runs detector over every frame of video, batch_size frames per forward pass.
+
+        The detections are written to the cache atomically and returned.
+        """
+        import cv2
+
+        cap = cv2.VideoCapture(video)
+        per_frame, batch = [], []
+        while True:
+            ret, frame = cap.read()
+            if ret:
+                batch.append(frame)
+            if batch and (len(batch) == batch_size or not ret):
+                per_frame.extend(detector.detect_batch(batch))
+                batch = []
+            if not ret:
+                break
+        cap.release()
+
+        table = FrameDetections.table(per_frame)
+        path = self.path(video, detector)
+        os.makedirs(self.cache_dir, exist_ok=True)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            np.save(f, table)
+        os.replace(tmp_path, path)
+        return FrameDetections(np.load(path, mmap_mode="r"))
+
+    def get(self, video, detector, batch_size=8):
+        """Returns the cached detections of video, building them first if needed."""
+        detections = self.load(video, detector)
+        if detections is None:
+            detections = self.build(video, detector, batch_size)
+        return detections
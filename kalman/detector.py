@@ -0,0 +1,226 @@
+"""YOLOv5 person detector for the tracking scripts."""
+
+import os
+
+import numpy as np
+
+DEFAULT_CACHE_DIR = os.environ.get(
+    "YOLOV5_CACHE", os.path.join(os.path.expanduser("~"), ".cache", "yolov5")
+)
+HUB_REPO = "ultralytics/yolov5"
+PERSON_CLASS = 0
+
+
+class PersonDetector(object):
+    """YOLOv5 restricted to the person class, loaded lazily from a local cache.
+
+    The hub checkout and the weights live in cache_dir, so once they are there the model loads
+    without network access. Missing ones are fetched into it on first use, unless
+    allow_download is False. The model is loaded and warmed up by the first detection, and
+    runs in inference mode with threads CPU threads when given.
+    """
+
+    def __init__(
+        self,
+        model_name="yolov5s",
+        cache_dir=DEFAULT_CACHE_DIR,
+        conf=0.25,
+        threads=None,
+        device="cpu",
+        img_size=640,
+        allow_download=True,
+    ):
+        """Configures the detector, nothing is loaded yet."""
+        self.model_name = model_name
+        self.cache_dir = cache_dir
+        self.conf = conf
+        self.threads = threads
+        self.device = device
+        self.img_size = img_size
+        self.allow_download = allow_download
+        self._model = None
+
+    @property
+    def repo_dir(self):
+        """Local checkout of the hub repository."""
+        return os.path.join(self.cache_dir, HUB_REPO.replace("/", "_") + "_master")
+
+    @property
+    def weights_path(self):
+        """Local weights of the model."""
+        return os.path.join(self.cache_dir, self.model_name + ".pt")
+
+    @property
+    def model(self):
+        """The loaded model, loading it on first access."""
+        if self._model is None:
+            self._model = self._load()
+        return self._model
+
+    def _load(self):
+        """Loads the model from the cache, or fetches it into the cache, and warms it up."""
+        import torch
+
+        if self.threads:
+            torch.set_num_threads(self.threads)
+        cached = os.path.isdir(self.repo_dir) and os.path.isfile(self.weights_path)
+        if cached:
+            model = torch.hub.load(
+                self.repo_dir,
+                "custom",
+                path=self.weights_path,
+                source="local",
+                device=self.device,
+            )
+        elif not self.allow_download:
+            raise IOError(
+                "%s is not cached in %s, allow downloads once to fetch it"
+                % (self.model_name, self.cache_dir)
+            )
+        else:
+            os.makedirs(self.cache_dir, exist_ok=True)
+            torch.hub.set_dir(self.cache_dir)
+            model = torch.hub.load(
+                HUB_REPO, "custom", path=self.weights_path, device=self.device
+            )
+        model.conf = self.conf
+        model.classes = [PERSON_CLASS]
+        model.eval()
+        with torch.inference_mode():
+            model(np.zeros((self.img_size, self.img_size, 3), dtype=np.uint8))
+        return model
+
+    def detect(self, frame):
+        """Returns the (N,5) [x1,y1,x2,y2,score] person detections of a BGR frame."""
+        return self.detect_batch([frame])[0]
+
+    def detect_batch(self, frames, size=None):
+        """Runs the BGR frames through the model in one forward pass.
+
+        Frames are letterboxed to size pixels, img_size by default. Returns the (N,5)
+        [x1,y1,x2,y2,score] person detections of every frame.
+        """
+        import torch
+
+        model = self.model
+        with torch.inference_mode():
+            results = model([f[:, :, ::-1] for f in frames], size=size or self.img_size)
+        return [self._person_dets(xyxy.cpu().numpy()) for xyxy in results.xyxy]
+
+    @staticmethod
+    def _person_dets(xyxy):
+        """Keeps the person rows of (N,6) [x1,y1,x2,y2,score,class] as (N,5) detections."""
+        dets = xyxy[xyxy[:, 5] == PERSON_CLASS, :5].astype(float)
+        dets[:, :4] = np.trunc(dets[:, :4])  # whole pixels, as the drawing code expects
+        return dets
+
+
+def roi_boxes(boxes, frame_shape, pad=0.5, min_size=32):
+    """Returns the (K,4) integer [x1,y1,x2,y2] regions to search for the (N,4+) boxes.
+
+    Every box is grown by pad times its width and height on each side, to at least min_size
+    pixels, and clipped to the (height, width) frame_shape. Overlapping regions are merged
+    until none overlap, so no object is detected in two regions.
+    """
+    from scipy.sparse.csgraph import connected_components
+
+    height, width = frame_shape[:2]
+    boxes = np.asarray(boxes, dtype=float)[:, :4] if len(boxes) else np.empty((0, 4))
+    margin = np.maximum(
+        pad * (boxes[:, 2:4] - boxes[:, 0:2]),
+        (min_size - (boxes[:, 2:4] - boxes[:, 0:2])) / 2.0,
+    )
+    rois = np.concatenate((boxes[:, 0:2] - margin, boxes[:, 2:4] + margin), axis=1)
+    rois = np.clip(np.round(rois), 0, [width, height, width, height]).astype(int)
+    rois = rois[(rois[:, 2] > rois[:, 0]) & (rois[:, 3] > rois[:, 1])]
+
+    while len(rois) > 1:
+        overlap = (
+            (rois[:, None, 0] < rois[None, :, 2])
+            & (rois[None, :, 0] < rois[:, None, 2])
+            & (rois[:, None, 1] < rois[None, :, 3])
+            & (rois[None, :, 1] < rois[:, None, 3])
+        )
+        n_regions, labels = connected_components(overlap, directed=False)
+        if n_regions == len(rois):
+            break
+        merged = np.empty((n_regions, 4), dtype=int)
+        merged[:, :2] = np.iinfo(int).max
+        merged[:, 2:] = np.iinfo(int).min
+        np.minimum.at(merged[:, 0], labels, rois[:, 0])
+        np.minimum.at(merged[:, 1], labels, rois[:, 1])
+        np.maximum.at(merged[:, 2], labels, rois[:, 2])
+        np.maximum.at(merged[:, 3], labels, rois[:, 3])
+        rois = merged
+    return rois
+
+
+class TrackGuidedDetector(object):
+    """Runs a :class:`PersonDetector` only around the boxes of the current tracks.
+
+    The regions of :func:`roi_boxes` around the tracks of tracker are cropped and run through
+    the model in one batch at roi_size pixels, and their detections are shifted back to frame
+    coordinates. Every full_interval calls, and whenever there is no track or the regions
+    cover more than max_roi_fraction of the frame, the whole frame is searched instead, which
+    is how new people are found.
+    """
+
+    def __init__(
+        self,
+        detector,
+        tracker,
+        full_interval=10,
+        pad=0.5,
+        roi_size=320,
+        max_roi_fraction=0.5,
+    ):
+        """Guides detector with the tracks of tracker, a ``Sort`` or ``BatchSort``.
+
+        On a detection thread of its own, pass the :class:`DetectionScheduler` feeding the
+        tracker instead, whose copy of the tracks is safe to read while the tracker runs and
+        is that of the previous frame, or covers the motion since when the copy lags.
+        """
+        self.detector = detector
+        self.tracker = tracker
+        self.full_interval = full_interval
+        self.pad = pad
+        self.roi_size = roi_size
+        self.max_roi_fraction = max_roi_fraction
+        self.calls = 0
+        self.full_calls = 0
+        self.searched_pixels = 0.0
+        self.frame_pixels = 0.0
+
+    def detect(self, frame):
+        """Returns the (N,5) [x1,y1,x2,y2,score] person detections of a BGR frame."""
+        frame_area = float(frame.shape[0] * frame.shape[1])
+        rois = roi_boxes(self.tracker.track_boxes(), frame.shape, self.pad)
+        roi_area = np.prod(rois[:, 2:4] - rois[:, 0:2], axis=1).sum()
+        self.calls += 1
+        self.frame_pixels += frame_area
+        if (
+            (self.calls - 1) % self.full_interval == 0
+            or len(rois) == 0
+            or roi_area > self.max_roi_fraction * frame_area
+        ):
+            self.full_calls += 1
+            self.searched_pixels += frame_area
+            return self.detector.detect(frame)
+
+        self.searched_pixels += roi_area
+        crops = [frame[y1:y2, x1:x2] for x1, y1, x2, y2 in rois]
+        dets = self.detector.detect_batch(crops, size=self.roi_size)
+        for d, (x1, y1, _, _) in zip(dets, rois):
+            d[:, 0:4] += [x1, y1, x1, y1]
+        return np.concatenate(dets)
+
+    def summary(self):
+        """Returns a printable line with the share of pixels searched."""
+        return (
+            "%d of %d detections on the full frame, %.1f%% of the pixels searched"
+            % (
+                self.full_calls,
+                self.calls,
+                100.0 * self.searched_pixels / max(self.frame_pixels, 1.0),
+            )
+        )
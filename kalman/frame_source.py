@@ -0,0 +1,165 @@
+"""Video frame source decoding ahead of the tracking loop."""
+
+import collections
+import queue
+import threading
+import time
+
+import cv2
+from stage_timing import TIMINGS
+
+_END = None
+_DECODE_TIMER = TIMINGS.stage("decode")
+
+
+class FrameSource(object):
+    """Iterates over the (index, frame) pairs of a video file or camera.
+
+    With threaded, frames are decoded on a background thread up to prefetch frames ahead of
+    the consumer. They are read into a ring of reusable buffers, so a yielded frame stays
+    valid only until hold more frames have been requested: hold must cover every frame the
+    consumer keeps at the same time, like the ones waiting in the queues of a pipeline.
+
+    With a stride of k only every k-th frame is decoded, the others are grabbed without being
+    retrieved, which skips their colour conversion and copy. Indices count every frame of
+    the video, skipped ones included. Files can be read from frame start to before frame end.
+    """
+
+    def __init__(
+        self, video, stride=1, prefetch=4, hold=1, threaded=True, start=0, end=None
+    ):
+        """Opens video, a file name or a camera index."""
+        self.cap = cv2.VideoCapture(int(video) if str(video).isdigit() else video)
+        self.fps = self.cap.get(cv2.CAP_PROP_FPS) or 25.0
+        if start:
+            self.cap.set(cv2.CAP_PROP_POS_FRAMES, start)
+        self.start = start
+        self.end = end
+        self.stride = stride
+        self.prefetch = prefetch
+        self.hold = hold
+        self.threaded = threaded
+        self.frames = 0
+        self.skipped = 0
+        self.decode_time = 0.0
+        self.wait_time = 0.0
+        self._buffers = []
+        self._stop = threading.Event()
+        self._error = None
+
+    def __iter__(self):
+        """Yields (index, frame) for every decoded frame."""
+        self._buffers = [None] * (self.prefetch + self.hold + 1)
+        return self._iter_threaded() if self.threaded else self._iter_inline()
+
+    def close(self):
+        """Stops decoding and releases the video."""
+        self._stop.set()
+        self.cap.release()
+
+    def summary(self):
+        """Returns a printable line with the decode cost per frame."""
+        return (
+            "decoded %d frames (%d skipped) at %.2f ms per frame, "
+            "waited %.2f ms per frame"
+            % (
+                self.frames,
+                self.skipped,
+                1000.0 * self.decode_time / max(self.frames, 1),
+                1000.0 * self.wait_time / max(self.frames, 1),
+            )
+        )
+
+    def _read(self, index, slot):
+        """Decodes frame index into buffer slot, grabbing the skipped frames before it.
+
+        Returns True once decoded, None for a skipped frame and False at the end of the video.
+        """
+        if self.end is not None and index >= self.end:
+            return False
+        start = time.perf_counter()
+        try:
+            if index % self.stride:
+                if not self.cap.grab():
+                    return False
+                self.skipped += 1
+                return None
+            ret, frame = self.cap.read(self._buffers[slot])
+            if not ret:
+                return False
+            self._buffers[slot] = frame
+            self.frames += 1
+            return True
+        finally:
+            elapsed = time.perf_counter() - start
+            self.decode_time += elapsed
+            if TIMINGS.enabled:
+                _DECODE_TIMER.record(elapsed)
+
+    def _iter_inline(self):
+        """Decodes every frame when it is requested."""
+        slot = 0
+        index = self.start
+        try:
+            while not self._stop.is_set():
+                read = self._read(index, slot)
+                if read is False:
+                    break
+                if read:
+                    yield index, self._buffers[slot]
+                    slot = (slot + 1) % len(self._buffers)
+                index += 1
+        finally:
+            self.close()
+
+    def _iter_threaded(self):
+        """Yields the frames decoded by the background thread."""
+        free = queue.Queue()
+        for slot in range(len(self._buffers)):
+            free.put(slot)
+        ready = queue.Queue()
+        thread = threading.Thread(
+            target=self._decode_loop, args=(free, ready), name="decode", daemon=True
+        )
+        thread.start()
+        held = collections.deque()
+        try:
+            while True:
+                while len(held) > self.hold - 1:
+                    free.put(held.popleft())
+                start = time.perf_counter()
+                item = ready.get()
+                self.wait_time += time.perf_counter() - start
+                if item is _END:
+                    break
+                index, slot = item
+                held.append(slot)
+                yield index, self._buffers[slot]
+        finally:
+            self._stop.set()
+            free.put(None)  # wakes the decoder if it waits for a buffer
+            thread.join()
+            self.close()
+        if self._error is not None:
+            raise self._error
+
+    def _decode_loop(self, free, ready):
+        """Decodes frames into free buffers and passes them to the consumer."""
+        index = self.start
+        try:
+            while not self._stop.is_set():
+                slot = free.get()
+                if slot is None:
+                    break
+                read = self._read(index, slot)
+                while read is None and not self._stop.is_set():
+                    index += 1
+                    read = self._read(index, slot)
+                if not read:
+                    break
+                ready.put((index, slot))
+                index += 1
+        except Exception as error:
+            self._error = error
+        finally:
+            ready.put(_END)
@@ -1,60 +1,371 @@
 """Program to follow people using Kalman filter."""
 
+import argparse
+import threading
+
 import cv2
-import numpy as np
-import torch
-from sort import Sort
-
-model = torch.hub.load("ultralytics/yolov5", "yolov5s", pretrained=True)
-
-
-def person_tracking():
-    """Function to follow people in video."""
-    cap = cv2.VideoCapture(r"test.mp4")
-    mot_tracker = Sort()
-    frameID = 0
-    skip_frame = 10000
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-
-        if frameID % skip_frame == 0:
-            results = model(frame)
-            results = results.xyxy[0].numpy()
-            person_detections = results[results[:, 5] == 0]
-
-        dets = []
-        for *xyxy, conf, cls in person_detections:
-            x1, y1, x2, y2 = map(int, xyxy)
-            dets.append([x1, y1, x2, y2, conf])
-        dets = np.array(dets)
-
-        trackers = mot_tracker.update(dets)
-
-        for d in trackers:
-            x1, y1, x2, y2, track_id = map(int, d[:5])
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 3)
-            cv2.putText(
-                frame,
-                str(track_id),
-                (x1, y1 - 10),
-                cv2.FONT_HERSHEY_PLAIN,
-                2,
-                (0, 255, 0),
-                thickness=2,
-            )
+from detection_cache import DetectionCache
+from detector import DEFAULT_CACHE_DIR, PersonDetector, TrackGuidedDetector
+from frame_source import FrameSource
+from mot_io import TrackResultWriter
+from pipeline import Pipeline
+from recording import Throughput, VideoRecorder
+from scheduler import DetectionScheduler
+from segments import track_video, write_tracks
+from sort import BatchSort
+from stage_timing import TIMINGS
+
+
+def detect_stage(scheduler, detector, detections=None, stop=None):
+    """Returns the stage adding the detections to (frameID, frame) when scheduled.
+
+    Coasting frames get None. With :class:`FrameDetections`, their detections are used in
+    place of the detector. stop is the event of the pipeline, ending the wait of the
+    scheduler for the track stage.
+    """
+    detect_timer = TIMINGS.stage("detection")
+
+    def detect(item):
+        frameID, frame = item
+
+        def run(frame):
+            with detect_timer:
+                if detections is not None:
+                    return detections[frameID]
+                return detector.detect(frame)
+
+        return frameID, frame, scheduler.schedule(run, frame, stop)
+
+    return detect
+
+
+def track_stage(scheduler):
+    """Returns the stage replacing the detections of an item by the tracks."""
+
+    def track(item):
+        frameID, frame, dets = item
+        return frameID, frame, scheduler.track(dets)
 
-        cv2.imshow("view", frame)
+    return track
 
-        key = cv2.waitKey(1)
-        if key == 27:
-            break
 
-    cap.release()
-    cv2.destroyAllWindows()
+def draw_tracks(frame, trackers):
+    """Draws the tracks with their id on frame."""
+    for d in trackers:
+        x1, y1, x2, y2, track_id = map(int, d[:5])
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 3)
+        cv2.putText(
+            frame,
+            str(track_id),
+            (x1, y1 - 10),
+            cv2.FONT_HERSHEY_PLAIN,
+            2,
+            (0, 255, 0),
+            thickness=2,
+        )
+
+
+def person_tracking(
+    video=r"test.mp4",
+    live=False,
+    threaded=True,
+    queue_size=2,
+    max_interval=30,
+    max_uncertainty=8.0,
+    max_new_objects=0.5,
+    detector=None,
+    full_interval=None,
+    det_cache=None,
+    headless=False,
+    output=None,
+    binary_output=False,
+    record=None,
+    stride=1,
+    timings=None,
+    timings_interval=10.0,
+):
+    """Function to follow people in video.
+
+    Decoding, detection and tracking run as stages of a :class:`Pipeline`, each on its own
+    thread, while this thread draws and shows the frames. For live sources the reader drops
+    the oldest waiting frame instead of falling behind. A :class:`DetectionScheduler` runs
+    YOLO only when the tracks need it, see there for max_interval, max_uncertainty and
+    max_new_objects, the tracks coast on the other frames. Recorded videos wait for the
+    tracks of the previous frame before deciding, so a run gives the same tracks threaded
+    or not, live sources decide on the latest tracks instead. detector defaults to a
+    :class:`PersonDetector` with its default settings. With full_interval, it only searches
+    around the tracks, and the full frame once every full_interval detections, see
+    :class:`TrackGuidedDetector`. Recorded videos can instead be detected once into the
+    det_cache directory, a :class:`DetectionCache` that later runs replay from.
+
+    Headless runs show nothing and only draw the frames recorded to the record video. The
+    tracks of every frame are written to output, as MOT text or binary_output records.
+
+    Frames are decoded ahead by a :class:`FrameSource`, only every stride-th frame is tracked.
+
+    With timings, the duration of every stage is measured and exported to that file every
+    timings_interval seconds, as Prometheus text when its name ends with ``.prom``.
+    """
+    if timings:
+        TIMINGS.enable(timings, timings_interval)
+    render_timer = TIMINGS.stage("render")
+    output_timer = TIMINGS.stage("output")
+    detector = detector or PersonDetector()
+    detections = None
+    if det_cache and not video.isdigit():
+        detections = DetectionCache(det_cache).get(video, detector)
+    # BatchSort gives the tracks of Sort without loading filterpy on the first frame
+    mot_tracker = BatchSort()
+    mot_tracker.preload()
+    scheduler = DetectionScheduler(
+        mot_tracker,
+        max_interval=max_interval,
+        max_uncertainty=max_uncertainty,
+        max_new_objects=max_new_objects,
+        lagged=live,
+    )
+    if full_interval and detections is None:
+        # the detect stage reads the tracks from the scheduler, not the busy tracker
+        detector = TrackGuidedDetector(detector, scheduler, full_interval)
+
+    source = FrameSource(video, stride, hold=1)
+    stop = threading.Event()
+    pipeline = Pipeline(
+        source,
+        [
+            ("detect", detect_stage(scheduler, detector, detections, stop)),
+            ("track", track_stage(scheduler)),
+        ],
+        queue_size=queue_size,
+        drop_oldest=live,
+        threaded=threaded,
+        stop_event=stop,
+    )
+    throughput = Throughput()
+    writer = TrackResultWriter(output, binary_output) if output else None
+    recorder = None
+    if record:
+        recorder = VideoRecorder(record, source.fps / stride)
+    # frames are decoded into reused buffers, which must outlive the ones in flight
+    source.hold = pipeline.capacity + (recorder.capacity if recorder else 0)
+    try:
+        for frameID, frame, trackers in pipeline:
+            TIMINGS.tick()
+            throughput.add(trackers)
+            if writer is not None:
+                with output_timer:
+                    writer.add(frameID + 1, trackers)
+            if headless and recorder is None:
+                continue
+
+            with render_timer:
+                draw_tracks(frame, trackers)
+            if recorder is not None:
+                with output_timer:
+                    recorder.write(frame)
+            if not headless:
+                with render_timer:
+                    cv2.imshow("view", frame)
+                    key = cv2.waitKey(1)
+                if key == 27:
+                    pipeline.stop()
+    finally:
+        if writer is not None:
+            writer.close()
+        if recorder is not None:
+            recorder.close()
+
+    if not headless:
+        cv2.destroyAllWindows()
+    print(throughput.summary())
+    print(source.summary())
+    print(pipeline.summary())
+    print(scheduler.summary())
+    if full_interval and detections is None:
+        print(detector.summary())
+    if timings:
+        TIMINGS.export()
+        print(TIMINGS.table())
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description="YOLOv5 + SORT person tracking")
+    parser.add_argument(
+        "--video", help="Video file or camera index [test.mp4]", default="test.mp4"
+    )
+    parser.add_argument(
+        "--live",
+        help="Drop the oldest frames instead of falling behind the source",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--serial", help="Run all the stages on one thread", action="store_true"
+    )
+    parser.add_argument(
+        "--queue_size", help="Items buffered between stages [2]", type=int, default=2
+    )
+    parser.add_argument(
+        "--max_interval",
+        help="Most frames between two detector runs [30]",
+        type=int,
+        default=30,
+    )
+    parser.add_argument(
+        "--max_uncertainty",
+        help="Track centre uncertainty in pixels that triggers the detector [8.0]",
+        type=float,
+        default=8.0,
+    )
+    parser.add_argument(
+        "--max_new_objects",
+        help="Expected number of new people that triggers the detector [0.5]",
+        type=float,
+        default=0.5,
+    )
+    parser.add_argument(
+        "--model", help="YOLOv5 model name [yolov5s]", type=str, default="yolov5s"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Directory of the cached model [%s]" % DEFAULT_CACHE_DIR,
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--no_download",
+        help="Fail instead of fetching a model missing from the cache",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--conf", help="Detection confidence threshold [0.25]", type=float, default=0.25
+    )
+    parser.add_argument(
+        "--threads", help="CPU threads of the model [torch default]", type=int
+    )
+    parser.add_argument(
+        "--roi",
+        help="Search only around the tracks, and the full frame every N detections",
+        type=int,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--det_cache",
+        help="Detect a recorded video once into this directory and replay from it",
+        type=str,
+    )
+    parser.add_argument(
+        "--headless", help="Do not show the frames", action="store_true"
+    )
+    parser.add_argument(
+        "--output", help="Write the tracks of every frame to this file", type=str
+    )
+    parser.add_argument(
+        "--binary_output",
+        help="Write binary track records instead of MOT text",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--record", help="Encode the annotated frames to this video file", type=str
+    )
+    parser.add_argument(
+        "--stride", help="Track every N-th frame only [1]", type=int, default=1
+    )
+    parser.add_argument(
+        "--segments",
+        help="Track the video offline in N segments on parallel processes into --output",
+        type=int,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--overlap",
+        help="Frames shared by consecutive segments to stitch the tracks [30]",
+        type=int,
+        default=30,
+    )
+    parser.add_argument(
+        "--timings",
+        help="Time the stages and export them to this JSON, or Prometheus .prom, file",
+        type=str,
+    )
+    parser.add_argument(
+        "--timings_interval",
+        help="Seconds between two exports of the timings [10]",
+        type=float,
+        default=10.0,
+    )
+    args = parser.parse_args()
+    if args.segments:
+        # segments are tracked offline from the file, without the pipeline or a display
+        unsupported = [
+            flag
+            for flag, given in (
+                ("--live", args.live),
+                ("--serial", args.serial),
+                ("--roi", args.roi),
+                ("--det_cache", args.det_cache),
+                ("--record", args.record),
+                ("--stride", args.stride != 1),
+                ("--timings", args.timings),
+            )
+            if given
+        ]
+        if unsupported:
+            parser.error("--segments cannot be used with %s" % ", ".join(unsupported))
+        if args.video.isdigit():
+            parser.error("--segments needs a video file, not a camera")
+        if not args.output:
+            parser.error("--segments needs --output")
+    return args
 
 
 if __name__ == "__main__":
-    person_tracking()
+    args = parse_args()
+    if args.segments:
+        rows = track_video(
+            args.video,
+            "person",
+            dict(
+                model_name=args.model,
+                cache_dir=args.cache_dir,
+                conf=args.conf,
+                threads=args.threads or 1,
+                allow_download=not args.no_download,
+            ),
+            {},
+            n_segments=args.segments,
+            overlap=args.overlap,
+            workers=args.segments,
+            scheduler_settings=dict(
+                max_interval=args.max_interval,
+                max_uncertainty=args.max_uncertainty,
+                max_new_objects=args.max_new_objects,
+            ),
+        )
+        write_tracks(args.output, rows, args.binary_output)
+    else:
+        person_tracking(
+            args.video,
+            live=args.live,
+            threaded=not args.serial,
+            queue_size=args.queue_size,
+            max_interval=args.max_interval,
+            max_uncertainty=args.max_uncertainty,
+            max_new_objects=args.max_new_objects,
+            detector=PersonDetector(
+                args.model,
+                args.cache_dir,
+                conf=args.conf,
+                threads=args.threads,
+                allow_download=not args.no_download,
+            ),
+            full_interval=args.roi,
+            det_cache=args.det_cache,
+            headless=args.headless,
+            output=args.output,
+            binary_output=args.binary_output,
+            record=args.record,
+            stride=args.stride,
+            timings=args.timings,
+            timings_interval=args.timings_interval,
+        )
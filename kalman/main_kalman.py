@@ -1,56 +1,237 @@
 """Detect object without YOLO and track with SORT."""
 
+import argparse
+
 import cv2
-import numpy as np
-from sort import Sort
-
-
-def object_tracking():
-    """Object tracking function."""
-    cap = cv2.VideoCapture(r"test.mp4")
-
-    object_detector = cv2.createBackgroundSubtractorMOG2(history=500, varThreshold=40)
-    mot_tracker = Sort()
-
-    while True:
-        ret, frame = cap.read()
-        if not ret:
-            break
-        mask = object_detector.apply(frame)
-        _, mask = cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)
-        mask = cv2.GaussianBlur(mask, (5, 5), 0)
-        contours, _ = cv2.findContours(mask, cv2.RETR_TREE, cv2.CHAIN_APPROX_SIMPLE)
-        dets = []
-        for cnt in contours:
-            area = cv2.contourArea(cnt)
-            if area > 2000:
-                x, y, w, h = cv2.boundingRect(cnt)
-                dets.append([x, y, x + w, y + h, 1.0])
-                cv2.drawContours(frame, [cnt], -1, (0, 0, 255), 2)
-        dets = np.array(dets)
-        trackers = mot_tracker.update(dets)
-
-        for d in trackers:
-            x1, y1, x2, y2, track_id = map(int, d)
-            cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 3)
-            cv2.putText(
-                frame,
-                str(track_id),
-                (x1, y1 - 10),
-                cv2.FONT_HERSHEY_SIMPLEX,
-                2,
-                (0, 255, 0),
-                thickness=2,
-            )
+from frame_source import FrameSource
+from mot_io import TrackResultWriter
+from motion_detector import MotionDetector
+from recording import Throughput, VideoRecorder
+from segments import track_video, write_tracks
+from sort import BatchSort
+from stage_timing import TIMINGS
+
+
+def draw_tracks(frame, dets, trackers):
+    """Draws the detections and the tracks with their id on frame."""
+    for x1, y1, x2, y2, _ in dets.astype(int):
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 0, 255), 2)
+    for d in trackers:
+        x1, y1, x2, y2, track_id = map(int, d)
+        cv2.rectangle(frame, (x1, y1), (x2, y2), (0, 255, 0), 3)
+        cv2.putText(
+            frame,
+            str(track_id),
+            (x1, y1 - 10),
+            cv2.FONT_HERSHEY_SIMPLEX,
+            2,
+            (0, 255, 0),
+            thickness=2,
+        )
+
+
+def read_roi_mask(path):
+    """Reads the grayscale ROI mask image at path, failing when it cannot be read."""
+    roi_mask = cv2.imread(path, cv2.IMREAD_GRAYSCALE)
+    if roi_mask is None:
+        raise ValueError("Cannot read the ROI mask image %s" % path)
+    return roi_mask
+
+
+def object_tracking(
+    video=r"test.mp4",
+    scale=0.5,
+    min_area=2000,
+    roi_mask=None,
+    headless=False,
+    output=None,
+    binary_output=False,
+    record=None,
+    stride=1,
+    timings=None,
+    timings_interval=10.0,
+):
+    """Object tracking function.
+
+    Moving objects are found by a :class:`MotionDetector` working on frames downscaled by
+    scale, keeping blobs larger than min_area pixels inside the optional roi_mask image.
 
-        cv2.imshow("view", frame)
-        key = cv2.waitKey(1)
-        if key == 27:  # ESC
-            break
+    Headless runs show nothing and only draw the frames recorded to the record video. The
+    tracks of every frame are written to output, as MOT text or binary_output records.
 
-    cap.release()
-    cv2.destroyAllWindows()
+    Frames are decoded ahead by a :class:`FrameSource`, only every stride-th frame is tracked.
+
+    With timings, the duration of every stage is measured and exported to that file every
+    timings_interval seconds, as Prometheus text when its name ends with ``.prom``.
+    """
+    if timings:
+        TIMINGS.enable(timings, timings_interval)
+    detect_timer = TIMINGS.stage("detection")
+    render_timer = TIMINGS.stage("render")
+    output_timer = TIMINGS.stage("output")
+    if roi_mask is not None:
+        roi_mask = read_roi_mask(roi_mask)
+    source = FrameSource(video, stride)
+
+    object_detector = MotionDetector(scale, min_area, roi_mask)
+    # BatchSort gives the tracks of Sort without loading filterpy on the first frame
+    mot_tracker = BatchSort()
+    mot_tracker.preload()
+
+    throughput = Throughput()
+    writer = TrackResultWriter(output, binary_output) if output else None
+    recorder = None
+    if record:
+        recorder = VideoRecorder(record, source.fps / stride)
+        # frames are decoded into reused buffers, which must outlive the recorded ones
+        source.hold = 1 + recorder.capacity
+    try:
+        for frameID, frame in source:
+            TIMINGS.tick()
+            with detect_timer:
+                dets = object_detector.detect(frame)
+            trackers = mot_tracker.update(dets)
+            throughput.add(trackers)
+            if writer is not None:
+                with output_timer:
+                    writer.add(frameID + 1, trackers)
+            if headless and recorder is None:
+                continue
+
+            with render_timer:
+                draw_tracks(frame, dets, trackers)
+            if recorder is not None:
+                with output_timer:
+                    recorder.write(frame)
+            if not headless:
+                with render_timer:
+                    cv2.imshow("view", frame)
+                    key = cv2.waitKey(1)
+                if key == 27:  # ESC
+                    break
+    finally:
+        if writer is not None:
+            writer.close()
+        if recorder is not None:
+            recorder.close()
+
+    if not headless:
+        cv2.destroyAllWindows()
+    print(throughput.summary())
+    print(source.summary())
+    if timings:
+        TIMINGS.export()
+        print(TIMINGS.table())
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description="Motion detection + SORT tracking")
+    parser.add_argument("--video", help="Video file [test.mp4]", default="test.mp4")
+    parser.add_argument(
+        "--scale",
+        help="Downscale factor of the motion detection [0.5]",
+        type=float,
+        default=0.5,
+    )
+    parser.add_argument(
+        "--min_area",
+        help="Smallest moving blob in full resolution pixels [2000]",
+        type=float,
+        default=2000,
+    )
+    parser.add_argument(
+        "--roi_mask",
+        help="Image whose non-zero pixels are the region to watch",
+        type=str,
+    )
+    parser.add_argument(
+        "--headless", help="Do not show the frames", action="store_true"
+    )
+    parser.add_argument(
+        "--output", help="Write the tracks of every frame to this file", type=str
+    )
+    parser.add_argument(
+        "--binary_output",
+        help="Write binary track records instead of MOT text",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--record", help="Encode the annotated frames to this video file", type=str
+    )
+    parser.add_argument(
+        "--stride", help="Track every N-th frame only [1]", type=int, default=1
+    )
+    parser.add_argument(
+        "--segments",
+        help="Track the video offline in N segments on parallel processes into --output",
+        type=int,
+        metavar="N",
+    )
+    parser.add_argument(
+        "--overlap",
+        help="Frames shared by consecutive segments to stitch the tracks [30]",
+        type=int,
+        default=30,
+    )
+    parser.add_argument(
+        "--timings",
+        help="Time the stages and export them to this JSON, or Prometheus .prom, file",
+        type=str,
+    )
+    parser.add_argument(
+        "--timings_interval",
+        help="Seconds between two exports of the timings [10]",
+        type=float,
+        default=10.0,
+    )
+    args = parser.parse_args()
+    if args.segments:
+        # segments are tracked offline from the file, without a display
+        unsupported = [
+            flag
+            for flag, given in (
+                ("--record", args.record),
+                ("--stride", args.stride != 1),
+                ("--timings", args.timings),
+            )
+            if given
+        ]
+        if unsupported:
+            parser.error("--segments cannot be used with %s" % ", ".join(unsupported))
+        if not args.output:
+            parser.error("--segments needs --output")
+    return args
 
 
 if __name__ == "__main__":
-    object_tracking()
+    args = parse_args()
+    if args.segments:
+        roi_mask = None
+        if args.roi_mask is not None:
+            roi_mask = read_roi_mask(args.roi_mask)
+        rows = track_video(
+            args.video,
+            "motion",
+            dict(scale=args.scale, min_area=args.min_area, roi_mask=roi_mask),
+            {},
+            n_segments=args.segments,
+            overlap=args.overlap,
+            warmup=100,  # lets the background model settle before the segment
+            workers=args.segments,
+        )
+        write_tracks(args.output, rows, args.binary_output)
+    else:
+        object_tracking(
+            args.video,
+            scale=args.scale,
+            min_area=args.min_area,
+            roi_mask=args.roi_mask,
+            headless=args.headless,
+            output=args.output,
+            binary_output=args.binary_output,
+            record=args.record,
+            stride=args.stride,
+            timings=args.timings,
+            timings_interval=args.timings_interval,
+        )
@@ -0,0 +1,203 @@
+"""Fast reading of MOT challenge detection files."""
+
+import os
+
+import numpy as np
+
+CACHE_SUFFIX = ".npy"
+
+
+class MOTDetections(object):
+    """Detections of a MOT det.txt file indexed by frame.
+
+    The rows are sorted by frame once and converted from [x1,y1,w,h] to [x1,y1,x2,y2] in one
+    vectorized pass, then a frame -> offset index is built so that every frame is a zero-copy
+    view of the table. The processed table is kept as a binary ``.npy`` cache next to det.txt,
+    which is memory-mapped when reused and rebuilt whenever det.txt changes size or mtime.
+    """
+
+    def __init__(self, det_path, use_cache=True):
+        """Loads det_path, from its cache when it is up to date."""
+        self.det_path = det_path
+        self.cache_path = os.path.splitext(det_path)[0] + CACHE_SUFFIX
+        stat = os.stat(det_path)
+        stamp = (float(stat.st_size), stat.st_mtime)
+
+        table = self._load_cache(stamp) if use_cache else None
+        if table is None:
+            table = self._parse(stamp)
+            if use_cache:
+                self._save_cache(table)
+        table.flags.writeable = False
+
+        # row 0 stores the stamp of det.txt, the others [frame, x1, y1, x2, y2, score]
+        self._frames = table[1:, 0]
+        self._dets = table[1:, 1:6]
+        self.n_frames = int(self._frames[-1]) if len(self._frames) else 0
+        self._offsets = np.searchsorted(self._frames, np.arange(1, self.n_frames + 2))
+
+    def __len__(self):
+        """Number of frames of the sequence."""
+        return self.n_frames
+
+    def __getitem__(self, frame):
+        """Returns the (N,5) [x1,y1,x2,y2,score] detections of frame, numbered from 1."""
+        if frame < 1 or frame > self.n_frames:
+            return self._dets[:0]
+        return self._dets[self._offsets[frame - 1] : self._offsets[frame]]
+
+    def __iter__(self):
+        """Yields (frame, detections) for every frame, including frames without detections."""
+        for frame in range(1, self.n_frames + 1):
+            yield frame, self._dets[self._offsets[frame - 1] : self._offsets[frame]]
+
+    def _parse(self, stamp):
+        """Parses det.txt into the cached table layout."""
+        seq_dets = np.loadtxt(self.det_path, delimiter=",", ndmin=2)
+        table = np.zeros((len(seq_dets) + 1, 6))
+        table[0, :2] = stamp
+        if len(seq_dets):
+            seq_dets = seq_dets[np.argsort(seq_dets[:, 0], kind="stable")]
+            table[1:, 0] = seq_dets[:, 0]
+            table[1:, 1:6] = seq_dets[:, 2:7]
+            table[1:, 3:5] += table[1:, 1:3]  # convert to [x1,y1,w,h] to [x1,y1,x2,y2]
+        return table
+
+    def _load_cache(self, stamp):
+        """Memory-maps the cache, returns None when it is missing or stale."""
+        try:
+            table = np.load(self.cache_path, mmap_mode="r")
+        except (OSError, ValueError):
+            return None
+        if table.ndim != 2 or table.shape[1] != 6 or tuple(table[0, :2]) != stamp:
+            return None
+        return table
+
+    def _save_cache(self, table):
+        """Writes the cache atomically, silently skipping read-only locations."""
+        tmp_path = self.cache_path + ".tmp"
+        try:
+            with open(tmp_path, "wb") as f:
+                np.save(f, table)
+            os.replace(tmp_path, self.cache_path)
+        except OSError:
+            pass
+
+
+MOT_LINE = "%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1\n"
+# boxes are stored as doubles, so that converting to text gives the text writer's output
+TRACK_MAGIC = b"SORTTRK2"
+TRACK_DTYPE = np.dtype(
+    [
+        ("frame", "<i4"),
+        ("id", "<i4"),
+        ("x", "<f8"),
+        ("y", "<f8"),
+        ("w", "<f8"),
+        ("h", "<f8"),
+    ]
+)
+# the first version stored boxes as floats, which can change the last printed digit
+TRACK_DTYPES = {
+    b"SORTTRK1": np.dtype(
+        [
+            ("frame", "<i4"),
+            ("id", "<i4"),
+            ("x", "<f4"),
+            ("y", "<f4"),
+            ("w", "<f4"),
+            ("h", "<f4"),
+        ]
+    ),
+    TRACK_MAGIC: TRACK_DTYPE,
+}
+
+
+class TrackResultWriter(object):
+    """Collects the output of ``Sort.update`` and writes it in large blocks.
+
+    Rows are gathered as [frame, id, x, y, w, h] in a preallocated array that grows when needed
+    and is flushed once full, either as MOT challenge text, byte-identical to formatting every
+    track with MOT_LINE, or as binary TRACK_DTYPE records that :func:`read_track_results` loads
+    back.
+    """
+
+    def __init__(self, path, binary=False, block_rows=65536):
+        """Opens path for writing."""
+        self.path = path
+        self.binary = binary
+        self._file = open(path, "wb" if binary else "w")
+        if binary:
+            self._file.write(TRACK_MAGIC)
+        self._block = np.empty((block_rows, 6))
+        self._n = 0
+
+    def __enter__(self):
+        """Returns the writer itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Flushes and closes the file."""
+        self.close()
+
+    def add(self, frame, trackers):
+        """Adds the (N,5) [x1,y1,x2,y2,id] trackers returned by ``Sort.update`` for frame."""
+        rows = self._reserve(len(trackers))
+        rows[:, 0] = frame
+        rows[:, 1] = trackers[:, 4]
+        rows[:, 2:4] = trackers[:, 0:2]
+        rows[:, 4:6] = trackers[:, 2:4] - trackers[:, 0:2]
+
+    def add_rows(self, rows):
+        """Adds (N,6) [frame, id, x, y, w, h] rows."""
+        self._reserve(len(rows))[:] = rows
+
+    def _reserve(self, k):
+        """Returns the next k rows of the block, flushing or growing it first if needed."""
+        if self._n + k > len(self._block):
+            self.flush()
+            if k > len(self._block):
+                self._block = np.empty((max(k, 2 * len(self._block)), 6))
+        self._n += k
+        return self._block[self._n - k : self._n]
+
+    def flush(self):
+        """Writes the gathered rows."""
+        rows = self._block[: self._n]
+        if self.binary:
+            records = np.empty(len(rows), dtype=TRACK_DTYPE)
+            for i, name in enumerate(TRACK_DTYPE.names):
+                records[name] = rows[:, i]
+            records.tofile(self._file)
+        elif len(rows):
+            # a single formatting operation for the whole block
+            self._file.write(MOT_LINE * len(rows) % tuple(rows.ravel().tolist()))
+        self._n = 0
+
+    def close(self):
+        """Flushes the remaining rows and closes the file."""
+        if not self._file.closed:
+            self.flush()
+            self._file.close()
+
+
+def read_track_results(path):
+    """Memory-maps the TRACK_DTYPE records written by a binary :class:`TrackResultWriter`.
+
+    Files of the first version, with float boxes, are read with their own dtype.
+    """
+    with open(path, "rb") as f:
+        dtype = TRACK_DTYPES.get(f.read(len(TRACK_MAGIC)))
+    if dtype is None:
+        raise ValueError("%s is not a binary track result file" % path)
+    if os.path.getsize(path) == len(TRACK_MAGIC):
+        return np.empty(0, dtype=dtype)
+    return np.memmap(path, dtype=dtype, mode="r", offset=len(TRACK_MAGIC))
+
+
+def write_mot_text(path, records):
+    """Writes TRACK_DTYPE records as MOT challenge text."""
+    with TrackResultWriter(path, block_rows=max(len(records), 1)) as writer:
+        writer.add_rows(
+            np.stack([records[name] for name in records.dtype.names], axis=1)
+        )
@@ -0,0 +1,61 @@
+"""Moving object detection with background subtraction."""
+
+import cv2
+import numpy as np
+
+
+class MotionDetector(object):
+    """Finds the boxes of moving blobs with MOG2 on downscaled frames.
+
+    Frames are resized by scale before background subtraction, thresholding and blurring, and
+    the blobs are found with one connected components pass, which also gives their boxes and
+    pixel areas. Blobs smaller than min_area full resolution pixels are dropped. An optional
+    single channel roi_mask of the frame size limits the detection to its non-zero pixels.
+    """
+
+    def __init__(
+        self, scale=0.5, min_area=2000, roi_mask=None, history=500, var_threshold=40
+    ):
+        """Sets up the background subtractor."""
+        self.scale = scale
+        self.min_area = min_area
+        self.roi_mask = roi_mask
+        self.subtractor = cv2.createBackgroundSubtractorMOG2(
+            history=history, varThreshold=var_threshold
+        )
+        blur = max(3, int(round(5 * scale)) | 1)
+        self.blur_size = (blur, blur)
+        self._small_mask = None
+
+    def apply(self, frame):
+        """Returns the binary foreground mask of frame at the detection scale."""
+        if self.scale != 1.0:
+            frame = cv2.resize(
+                frame, None, fx=self.scale, fy=self.scale, interpolation=cv2.INTER_AREA
+            )
+        mask = self.subtractor.apply(frame)
+        _, mask = cv2.threshold(mask, 200, 255, cv2.THRESH_BINARY)
+        mask = cv2.GaussianBlur(mask, self.blur_size, 0)
+        if self.roi_mask is not None:
+            if self._small_mask is None or self._small_mask.shape != mask.shape:
+                self._small_mask = cv2.resize(
+                    self.roi_mask,
+                    (mask.shape[1], mask.shape[0]),
+                    interpolation=cv2.INTER_NEAREST,
+                )
+            mask = cv2.bitwise_and(mask, self._small_mask)
+        return mask
+
+    def detect(self, frame):
+        """Returns the (N,5) [x1,y1,x2,y2,score] boxes of the moving blobs of frame."""
+        mask = self.apply(frame)
+        _, _, stats, _ = cv2.connectedComponentsWithStats(
+            (mask > 0).view(np.uint8), connectivity=8
+        )
+        stats = stats[1:]  # label 0 is the background
+        stats = stats[stats[:, cv2.CC_STAT_AREA] > self.min_area * self.scale**2]
+        dets = np.ones((len(stats), 5))
+        dets[:, 0:2] = stats[:, 0:2]
+        dets[:, 2:4] = stats[:, 0:2] + stats[:, 2:4]
+        dets[:, 0:4] /= self.scale
+        return dets
@@ -0,0 +1,133 @@
+"""Host of many SORT trackers, one per camera stream, batched in a single process."""
+
+import numpy as np
+from sort import (
+    KalmanBoxBank,
+    associate_detections_to_trackers_gated,
+    convert_xs_to_bboxes,
+    get_assignment_solver,
+)
+
+
+class MultiStreamSort(object):
+    """Many logical SORT trackers sharing one :class:`KalmanBoxBank`.
+
+    Every stream has its own frame count and its own track id space, numbered from 1 as in
+    ``Sort``. The tracks of all the streams updated in the same tick are predicted in one
+    batched operation, associated in one call of
+    :func:`associate_detections_to_trackers_gated` with the streams as groups, and updated in
+    one batched operation. Each stream gives the same tracks as its own
+    ``BatchSort(gated=True)``.
+    """
+
+    def __init__(
+        self, max_age=30, min_hits=3, iou_threshold=0.3, assignment="hungarian"
+    ):
+        """Sets key parameters for SORT, shared by all the streams."""
+        self.max_age = max_age
+        self.min_hits = min_hits
+        self.iou_threshold = iou_threshold
+        self.assignment = get_assignment_solver(assignment)
+        self.bank = KalmanBoxBank()
+        self.slots = {}
+        self._track_slots = np.zeros(0, dtype=int)
+        self._frame_count = np.zeros(0, dtype=int)
+        self._next_id = np.zeros(0, dtype=int)
+
+    def __contains__(self, stream):
+        """Whether stream is hosted."""
+        return stream in self.slots
+
+    def add_stream(self, stream):
+        """Starts hosting stream, which must be hashable, and returns its slot."""
+        if stream not in self.slots:
+            self.slots[stream] = len(self._frame_count)
+            self._frame_count = np.append(self._frame_count, 0)
+            self._next_id = np.append(self._next_id, 0)
+        return self.slots[stream]
+
+    def remove_stream(self, stream):
+        """Drops stream and all of its tracks."""
+        slot = self.slots.pop(stream)
+        self._keep(self._track_slots != slot)
+
+    def update(self, frames):
+        """Updates the streams with their frame of detections.
+
+        frames maps each stream that has a new frame in this tick to its (N,5) detections,
+        unknown streams are added. Returns a dict mapping those streams to the (M,5)
+        [x1,y1,x2,y2,id] tracks that ``Sort.update`` would return.
+        """
+        streams = list(frames)
+        slots = np.array([self.add_stream(s) for s in streams], dtype=int)
+        self._frame_count[slots] += 1
+
+        # get predicted locations of the tracks of the updated streams
+        rows = np.flatnonzero(np.isin(self._track_slots, slots))
+        pos = self.bank.predict(rows)
+        valid = ~np.any(np.isnan(pos), axis=1)
+        if not valid.all():
+            keep = np.ones(len(self.bank), dtype=bool)
+            keep[rows[~valid]] = False
+            self._keep(keep)
+            rows = np.flatnonzero(np.isin(self._track_slots, slots))
+            pos = pos[valid]
+
+        dets = [np.reshape(frames[s], (-1, 5)) for s in streams]
+        det_slots = np.repeat(slots, [len(d) for d in dets])
+        dets = np.concatenate(dets) if dets else np.empty((0, 5))
+        matched, unmatched_dets, _ = associate_detections_to_trackers_gated(
+            dets,
+            pos,
+            self.iou_threshold,
+            det_slots,
+            self._track_slots[rows],
+            self.assignment,
+        )
+
+        # update matched tracks with assigned detections
+        if len(matched) > 0:
+            self.bank.update(rows[matched[:, 1]], dets[matched[:, 0], :4])
+
+        # create and initialise new tracks for unmatched detections
+        if len(unmatched_dets) > 0:
+            new_slots = det_slots[unmatched_dets]
+            self.bank.add(dets[unmatched_dets, :4], self._allocate_ids(new_slots))
+            self._track_slots = np.concatenate((self._track_slots, new_slots))
+
+        return self._collect_and_prune(streams, slots)
+
+    def _allocate_ids(self, new_slots):
+        """Returns the next ids of the streams of new tracks, in order of appearance."""
+        order = np.argsort(new_slots, kind="stable")
+        sorted_slots = new_slots[order]
+        first = np.searchsorted(sorted_slots, sorted_slots, side="left")
+        ids = np.empty(len(new_slots), dtype=int)
+        ids[order] = self._next_id[sorted_slots] + np.arange(len(new_slots)) - first
+        np.add.at(self._next_id, new_slots, 1)
+        return ids
+
+    def _collect_and_prune(self, streams, slots):
+        """Returns the confirmed tracks of the updated streams and removes dead tracks."""
+        bank = self.bank
+        frame_count = self._frame_count[self._track_slots]
+        confirmed = (
+            np.isin(self._track_slots, slots)
+            & (bank.time_since_update < 1)
+            & ((bank.hit_streak >= self.min_hits) | (frame_count <= self.min_hits))
+        )
+        # like Sort, report the most recently created tracks first
+        confirmed = np.flatnonzero(confirmed)[::-1]
+        ret = np.concatenate(
+            (convert_xs_to_bboxes(bank.x[confirmed]), bank.ids[confirmed, None] + 1.0),
+            axis=1,
+        )  # +1 as MOT benchmark requires positive
+        confirmed_slots = self._track_slots[confirmed]
+        tracks = {s: ret[confirmed_slots == slot] for s, slot in zip(streams, slots)}
+        self._keep(bank.time_since_update <= self.max_age)
+        return tracks
+
+    def _keep(self, mask):
+        """Keeps only the tracks selected by the boolean mask."""
+        self.bank.keep(mask)
+        self._track_slots = self._track_slots[mask]
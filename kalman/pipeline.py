@@ -0,0 +1,260 @@
+"""Staged pipeline running the steps of the video tracking scripts concurrently."""
+
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class StageStats(object):
+    """Counters of one pipeline stage."""
+
+    def __init__(self, name):
+        """Starts empty counters for stage name."""
+        self.name = name
+        self.items = 0
+        self.dropped = 0
+        self.busy = 0.0
+        self.waiting = 0.0
+        self.started = None
+        self.stopped = None
+
+    def as_dict(self):
+        """Returns the counters with the share of its lifetime the stage spent working."""
+        elapsed = max(
+            (self.stopped or time.perf_counter()) - (self.started or 0.0), 1e-9
+        )
+        return {
+            "name": self.name,
+            "items": self.items,
+            "dropped": self.dropped,
+            "busy_s": self.busy,
+            "waiting_s": self.waiting,
+            "utilization": self.busy / elapsed if self.started else 0.0,
+            "fps": self.items / self.busy if self.busy else 0.0,
+        }
+
+
+class Pipeline(object):
+    """Runs a source and a chain of stages on their own threads, joined by bounded queues.
+
+    The source is an iterable, stages are functions taking an item and returning the item for
+    the next stage, or None to drop it. Each stage processes its items in order on one thread,
+    so stages may keep state like a tracker. The results are yielded to the calling thread,
+    which acts as the sink, for example to draw and show the frames with OpenCV.
+
+    Full queues block the producer, so a slow stage throttles the whole pipeline instead of
+    buffering without bound. With drop_oldest, used for live sources that must not fall
+    behind, the source instead discards the oldest waiting item when its queue is full.
+    """
+
+    def __init__(
+        self,
+        source,
+        stages,
+        queue_size=2,
+        drop_oldest=False,
+        threaded=True,
+        stop_event=None,
+    ):
+        """Sets up the pipeline, stages is a list of (name, function) pairs.
+
+        Stages that wait on one another can share stop_event, a ``threading.Event`` set when
+        the pipeline stops, to give up waiting on a stage that has already finished.
+        """
+        self.source = source
+        self.stages = list(stages)
+        self.queue_size = queue_size
+        self.drop_oldest = drop_oldest
+        self.threaded = threaded
+        self.stats = [StageStats("source")] + [StageStats(n) for n, _ in self.stages]
+        self.sink_stats = StageStats("sink")
+        self._stop = stop_event or threading.Event()
+        self._error = None
+
+    def __iter__(self):
+        """Runs the pipeline, yielding the output of the last stage."""
+        return self._run_threaded() if self.threaded else self._run_serial()
+
+    @property
+    def capacity(self):
+        """Most items between the source and the sink at once, both of them included."""
+        if not self.threaded:
+            return 1
+        return (len(self.stages) + 1) * (self.queue_size + 1) + 1
+
+    def stop(self):
+        """Asks every stage to finish, the iteration then ends."""
+        self._stop.set()
+
+    def report(self):
+        """Returns the counters of every stage, the sink included."""
+        return [s.as_dict() for s in self.stats + [self.sink_stats]]
+
+    def summary(self):
+        """Returns the report as printable lines."""
+        return "\n".join(
+            "%-10s %7d items %5d dropped  busy %5.1f%%  %8.1f items/s"
+            % (r["name"], r["items"], r["dropped"], 100.0 * r["utilization"], r["fps"])
+            for r in self.report()
+        )
+
+    def _run_serial(self):
+        """Runs every stage inline, one item at a time, with the same accounting."""
+        for stats in self.stats + [self.sink_stats]:
+            stats.started = time.perf_counter()
+        source = iter(self.source)
+        try:
+            while not self._stop.is_set():
+                item = self._timed(self.stats[0], next, source, _END)
+                if item is _END:
+                    break
+                for (_, func), stats in zip(self.stages, self.stats[1:]):
+                    item = self._timed(stats, func, item)
+                    if item is None:
+                        break
+                if item is not None:
+                    yield from self._sink(item)
+        finally:
+            self._finish()
+
+    def _run_threaded(self):
+        """Starts one thread per stage and yields from the last queue."""
+        queues = [queue.Queue(self.queue_size) for _ in range(len(self.stages) + 1)]
+        threads = [
+            threading.Thread(
+                target=self._source_loop, args=(queues[0],), name="source", daemon=True
+            )
+        ]
+        for i, (name, func) in enumerate(self.stages):
+            threads.append(
+                threading.Thread(
+                    target=self._stage_loop,
+                    args=(func, self.stats[i + 1], queues[i], queues[i + 1]),
+                    name=name,
+                    daemon=True,
+                )
+            )
+        self.sink_stats.started = time.perf_counter()
+        for thread in threads:
+            thread.start()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(queues[-1])
+                self.sink_stats.waiting += time.perf_counter() - start
+                if item is _END or self._stop.is_set():
+                    break
+                yield from self._sink(item)
+        finally:
+            self._stop.set()
+            for thread in threads:
+                thread.join()
+            self._finish()
+        if self._error is not None:
+            raise self._error
+
+    def _sink(self, item):
+        """Hands item to the caller, the time until it asks for the next one is busy."""
+        start = time.perf_counter()
+        yield item
+        self.sink_stats.busy += time.perf_counter() - start
+        self.sink_stats.items += 1
+
+    def _finish(self):
+        """Closes the accounting of the stages that are still open."""
+        now = time.perf_counter()
+        for stats in self.stats + [self.sink_stats]:
+            stats.stopped = stats.stopped or now
+
+    def _timed(self, stats, func, *args):
+        """Calls func, counting its duration as busy time of stats."""
+        start = time.perf_counter()
+        result = func(*args)
+        stats.busy += time.perf_counter() - start
+        if result is not _END and result is not None:
+            stats.items += 1
+        return result
+
+    def _source_loop(self, out):
+        """Reads items from the source into the first queue."""
+        stats = self.stats[0]
+        stats.started = time.perf_counter()
+        try:
+            source = iter(self.source)
+            while not self._stop.is_set():
+                item = self._timed(stats, next, source, _END)
+                if item is _END:
+                    break
+                if self.drop_oldest:
+                    while True:
+                        try:
+                            out.put_nowait(item)
+                            break
+                        except queue.Full:
+                            try:
+                                out.get_nowait()
+                                stats.dropped += 1
+                            except queue.Empty:
+                                pass
+                else:
+                    self._put(out, item, stats)
+        except Exception as error:
+            self._fail(error)
+        finally:
+            stats.stopped = time.perf_counter()
+            self._put(out, _END, stats)
+
+    def _stage_loop(self, func, stats, inbox, out):
+        """Applies func to every item of inbox and passes the results on."""
+        stats.started = time.perf_counter()
+        try:
+            while True:
+                start = time.perf_counter()
+                item = self._get(inbox)
+                stats.waiting += time.perf_counter() - start
+                if item is _END or self._stop.is_set():
+                    break
+                item = self._timed(stats, func, item)
+                if item is not None:
+                    self._put(out, item, stats)
+        except Exception as error:
+            self._fail(error)
+        finally:
+            stats.stopped = time.perf_counter()
+            self._put(out, _END, stats)
+
+    def _fail(self, error):
+        """Records the first error of a stage and stops the pipeline."""
+        if self._error is None:
+            self._error = error
+        self._stop.set()
+
+    def _put(self, out, item, stats):
+        """Blocks until out has room for item, unless the pipeline stops."""
+        start = time.perf_counter()
+        while True:
+            try:
+                out.put(item, timeout=0.05)
+                break
+            except queue.Full:
+                if self._stop.is_set():
+                    if item is _END:
+                        # make room so that the consumer sees the end
+                        try:
+                            out.get_nowait()
+                        except queue.Empty:
+                            pass
+                    else:
+                        break
+        stats.waiting += time.perf_counter() - start
+
+    def _get(self, inbox):
+        """Takes the next item of inbox, or _END once the pipeline stops."""
+        while True:
+            try:
+                return inbox.get(timeout=0.05)
+            except queue.Empty:
+                if self._stop.is_set():
+                    return _END
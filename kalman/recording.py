@@ -0,0 +1,105 @@
+"""Output helpers of the video tracking scripts."""
+
+import queue
+import threading
+import time
+
+_END = object()
+
+
+class VideoRecorder(object):
+    """Encodes frames to a video file on a background thread.
+
+    Frames wait in a queue of queue_size, so encoding overlaps with tracking and only blocks
+    the caller when the encoder falls behind. The recorder owns the frames handed to
+    ``write``, they must not be modified afterwards.
+    """
+
+    def __init__(self, path, fps, fourcc="mp4v", queue_size=8):
+        """Records to path at fps frames per second, opened on the first frame."""
+        self.path = path
+        self.fps = fps
+        self.fourcc = fourcc
+        self.frames = 0
+        self.capacity = queue_size + 1  # frames the recorder holds at once
+        self._queue = queue.Queue(queue_size)
+        self._error = None
+        self._thread = threading.Thread(
+            target=self._encode, name="recorder", daemon=True
+        )
+        self._thread.start()
+
+    def __enter__(self):
+        """Returns the recorder itself."""
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Finishes encoding and closes the file."""
+        self.close()
+
+    def write(self, frame):
+        """Queues a BGR frame for encoding."""
+        if self._error is not None:
+            raise self._error
+        self._queue.put(frame)
+        self.frames += 1
+
+    def close(self):
+        """Waits for the queued frames to be encoded and closes the file."""
+        if self._thread.is_alive():
+            self._queue.put(_END)
+            self._thread.join()
+        if self._error is not None:
+            raise self._error
+
+    def _encode(self):
+        """Writes the queued frames until the end marker."""
+        import cv2
+
+        writer = None
+        try:
+            while True:
+                frame = self._queue.get()
+                if frame is _END:
+                    break
+                if writer is None:
+                    writer = cv2.VideoWriter(
+                        self.path,
+                        cv2.VideoWriter_fourcc(*self.fourcc),
+                        self.fps,
+                        (frame.shape[1], frame.shape[0]),
+                    )
+                writer.write(frame)
+        except Exception as error:
+            self._error = error
+            # keep draining so that write never blocks forever
+            while self._queue.get() is not _END:
+                pass
+        finally:
+            if writer is not None:
+                writer.release()
+
+
+class Throughput(object):
+    """Counts frames and tracks to print the throughput of a run."""
+
+    def __init__(self):
+        """Starts the clock."""
+        self.start_time = time.time()
+        self.frames = 0
+        self.tracks = 0
+
+    def add(self, trackers):
+        """Counts a frame and its tracks."""
+        self.frames += 1
+        self.tracks += len(trackers)
+
+    def summary(self):
+        """Returns a printable line with the frame rate since the start."""
+        total_time = time.time() - self.start_time
+        return "Processed %d frames and %d tracks in %.3f seconds (%.1f FPS)" % (
+            self.frames,
+            self.tracks,
+            total_time,
+            self.frames / max(total_time, 1e-9),
+        )
@@ -0,0 +1,174 @@
+"""Adaptive scheduling of the detector of a tracking loop."""
+
+import threading
+
+import numpy as np
+
+
+class TrackerState(object):
+    """Copy of the tracker state the scheduling needs, taken after a tracker step."""
+
+    def __init__(self, tracker=None, new_object_rate=0.0, frame=0):
+        """Copies the tracks of tracker after its frame-th frame, none without one."""
+        self.frame = frame
+        self.boxes = np.empty((0, 4))
+        self.velocities = np.empty((0, 2))
+        self.max_uncertainty = 0.0
+        self.new_object_rate = new_object_rate
+        if tracker is not None:
+            self.boxes = tracker.track_boxes()
+            self.velocities = tracker.track_velocities()
+            uncertainty = tracker.position_uncertainty()
+            if len(uncertainty):
+                self.max_uncertainty = float(uncertainty.max())
+
+
+class DetectionScheduler(object):
+    """Runs the detector only on the frames where the tracks need it.
+
+    On the other frames the tracker coasts with ``Sort.predict``. The detector runs when one of
+    these triggers fires:
+
+    - "start": no detection yet.
+    - "interval": max_interval frames passed since the last detection.
+    - "uncertainty": the centre of a track is uncertain by more than max_uncertainty pixels,
+      its standard deviation given by the Kalman covariance.
+    - "new_objects": at least max_new_objects new objects are expected to have appeared, from
+      the rate of new tracks measured on the previous detections.
+
+    No trigger is considered before min_interval frames pass.
+
+    The decision and the tracking can run on different threads, as stages of a pipeline:
+    ``schedule`` runs the detector when the :class:`TrackerState` published after the
+    previous tracker step calls for it, and ``track`` updates or coasts the tracker with the
+    result and publishes its new state. ``schedule`` waits for the state of the previous
+    frame, so the detector runs on the same frames and the tracks are the same as when both
+    run in a row, which ``step`` does. With lagged, used for live sources that must not
+    stall, it instead decides on the latest published state, which lags the tracker by the
+    frames in flight between the two.
+    """
+
+    def __init__(
+        self,
+        tracker,
+        min_interval=1,
+        max_interval=30,
+        max_uncertainty=8.0,
+        max_new_objects=0.5,
+        rate_smoothing=0.2,
+        lagged=False,
+    ):
+        """Schedules the detector feeding tracker, a ``Sort`` or ``BatchSort``."""
+        self.tracker = tracker
+        self.min_interval = min_interval
+        self.max_interval = max_interval
+        self.max_uncertainty = max_uncertainty
+        self.max_new_objects = max_new_objects
+        self.rate_smoothing = rate_smoothing
+        self.lagged = lagged
+        self.new_object_rate = 0.0
+        self.state = TrackerState()
+        self.frames = 0
+        self.detections = 0
+        self.frames_since_detection = 0
+        self.triggers = {"start": 0, "interval": 0, "uncertainty": 0, "new_objects": 0}
+        self._updates = 0
+        self._coasted = 0
+        self._tracked = 0
+        self._published = threading.Condition()
+
+    def trigger(self):
+        """Returns the reason to run the detector on the next frame, or None to coast."""
+        frames = self.frames_since_detection + 1
+        state = self.state
+        if self.detections == 0:
+            return "start"
+        if frames < self.min_interval:
+            return None
+        if frames >= self.max_interval:
+            return "interval"
+        if state.max_uncertainty > self.max_uncertainty:
+            return "uncertainty"
+        if state.new_object_rate * frames >= self.max_new_objects:
+            return "new_objects"
+        return None
+
+    def schedule(self, detect, frame, stop=None):
+        """Returns the (N,5) detections of detect(frame) when needed, else None.
+
+        Unless lagged, first waits until the state of the previous frame is published, or
+        until stop, a ``threading.Event``, is set, in which case None is returned.
+        """
+        if not self.lagged and not self._wait_for_state(stop):
+            return None
+        reason = self.trigger()
+        self.frames += 1
+        if reason is None:
+            self.frames_since_detection += 1
+            return None
+        self.triggers[reason] += 1
+        self.detections += 1
+        self.frames_since_detection = 0
+        return detect(frame)
+
+    def track(self, dets):
+        """Updates the tracker with dets, or coasts it when None, and publishes its state."""
+        if dets is None:
+            self._coasted += 1
+            tracks = self.tracker.predict()
+        else:
+            created = self.tracker.created
+            tracks = self.tracker.update(dets)
+            if self._updates:
+                rate = (self.tracker.created - created) / float(self._coasted + 1)
+                self.new_object_rate += self.rate_smoothing * (
+                    rate - self.new_object_rate
+                )
+            self._updates += 1
+            self._coasted = 0
+        with self._published:
+            self._tracked += 1
+            self.state = TrackerState(self.tracker, self.new_object_rate, self._tracked)
+            self._published.notify_all()
+        return tracks
+
+    def step(self, detect, frame):
+        """Tracks frame, calling detect(frame) for its (N,5) detections only when needed."""
+        return self.track(self.schedule(detect, frame))
+
+    def _wait_for_state(self, stop):
+        """Waits until every scheduled frame is tracked, returns False if stop is set first."""
+        with self._published:
+            while self._tracked < self.frames:
+                if stop is not None and stop.is_set():
+                    return False
+                self._published.wait(0.05)
+        return True
+
+    def track_boxes(self):
+        """Returns the (N,4) boxes of the tracks on the frame before the scheduled one.
+
+        These are the boxes of the published state, which is that of the previous frame
+        unless lagged. A lagged state is older, and each box is then grown to also cover
+        where its velocity takes it over the frames missing.
+        """
+        state = self.state
+        lag = self.frames - 1 - state.frame
+        if lag <= 0 or not len(state.boxes):
+            return state.boxes
+        shift = np.tile(lag * state.velocities, 2)
+        return np.concatenate(
+            (
+                np.minimum(state.boxes[:, 0:2], state.boxes[:, 0:2] + shift[:, 0:2]),
+                np.maximum(state.boxes[:, 2:4], state.boxes[:, 2:4] + shift[:, 2:4]),
+            ),
+            axis=1,
+        )
+
+    def summary(self):
+        """Returns a printable line with the share of frames run through the detector."""
+        return "detector ran on %d of %d frames (%s)" % (
+            self.detections,
+            self.frames,
+            ", ".join("%s %d" % item for item in self.triggers.items()),
+        )
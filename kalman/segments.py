@@ -0,0 +1,196 @@
+"""Offline tracking of a recorded video split into segments tracked in parallel."""
+
+import concurrent.futures
+import os
+
+import numpy as np
+from mot_io import TrackResultWriter
+from sort import BatchSort, KalmanBoxTracker, iou_batch, linear_assignment
+
+
+def plan_segments(n_frames, n_segments, overlap):
+    """Returns the [start, end) frame ranges of n_segments segments covering n_frames.
+
+    Every segment but the first starts overlap frames before the end of the previous one.
+    """
+    n_segments = max(1, min(n_segments, n_frames // max(2 * overlap, 1)))
+    bounds = np.linspace(0, n_frames, n_segments + 1).round().astype(int)
+    return [
+        (max(int(bounds[i]) - (overlap if i else 0), 0), int(bounds[i + 1]))
+        for i in range(n_segments)
+    ]
+
+
+def make_detector(kind, settings):
+    """Returns the detect(frame) function of a "motion" or "person" detector."""
+    if kind == "motion":
+        from motion_detector import MotionDetector
+
+        return MotionDetector(**settings).detect
+    if kind == "person":
+        from detector import PersonDetector
+
+        return PersonDetector(**settings).detect
+    raise ValueError("Unknown detector %r, expected motion or person" % kind)
+
+
+def track_segment(job):
+    """Tracks the frames [start, end) of a video with a fresh ``BatchSort``.
+
+    job is (video, start, end, warmup, kind, settings, tracker_settings,
+    scheduler_settings). The detector first sees the warmup frames before start, so that a
+    background model is learnt, without tracking them. With scheduler_settings, the detector
+    only runs on the frames a :class:`DetectionScheduler` made with them asks for, and the
+    tracks coast in between. Returns the (M,6) [frame, id, x1, y1, x2, y2] rows of the
+    tracks, frames numbered from 0 and ids local to the segment.
+    """
+    from frame_source import FrameSource
+    from scheduler import DetectionScheduler
+
+    video, start, end, warmup, kind, settings, tracker_settings, scheduler_settings = (
+        job
+    )
+    detect = make_detector(kind, settings)
+    KalmanBoxTracker.count = 0
+    mot_tracker = BatchSort(**tracker_settings)
+    mot_tracker.preload()
+    scheduler = None
+    if scheduler_settings is not None:
+        scheduler = DetectionScheduler(mot_tracker, **scheduler_settings)
+    rows = []
+    for frameID, frame in FrameSource(video, start=max(start - warmup, 0), end=end):
+        if frameID < start:
+            detect(frame)
+            continue
+        if scheduler is not None:
+            trackers = scheduler.step(detect, frame)
+        else:
+            trackers = mot_tracker.update(detect(frame))
+        block = np.empty((len(trackers), 6))
+        block[:, 0] = frameID
+        block[:, 1] = trackers[:, 4]
+        block[:, 2:6] = trackers[:, 0:4]
+        rows.append(block)
+    return np.concatenate(rows) if rows else np.empty((0, 6))
+
+
+def match_overlap(previous, current, start, end, iou_threshold=0.5, min_frames=3):
+    """Matches the track ids of two segments over their overlapping frames [start, end).
+
+    The IOU of every pair of tracks seen on the same frame is summed, the pairs are assigned
+    to maximise it, and a pair is kept when its mean IOU over the frames both tracks share is
+    at least iou_threshold on at least min_frames frames. Returns {current id: previous id}.
+    """
+    previous = previous[(previous[:, 0] >= start) & (previous[:, 0] < end)]
+    current = current[(current[:, 0] >= start) & (current[:, 0] < end)]
+    prev_ids, prev_idx = np.unique(previous[:, 1], return_inverse=True)
+    cur_ids, cur_idx = np.unique(current[:, 1], return_inverse=True)
+    iou_sum = np.zeros((len(prev_ids), len(cur_ids)))
+    shared = np.zeros((len(prev_ids), len(cur_ids)))
+    for frame in np.intersect1d(previous[:, 0], current[:, 0]):
+        p = previous[:, 0] == frame
+        c = current[:, 0] == frame
+        rows, cols = np.ix_(prev_idx[p], cur_idx[c])
+        iou_sum[rows, cols] += iou_batch(previous[p, 2:6], current[c, 2:6])
+        shared[rows, cols] += 1
+    if iou_sum.size == 0:
+        return {}
+    matched = linear_assignment(-iou_sum)
+    p, c = matched[:, 0], matched[:, 1]
+    keep = (shared[p, c] >= min_frames) & (
+        iou_sum[p, c] >= iou_threshold * np.maximum(shared[p, c], 1)
+    )
+    return dict(zip(cur_ids[c[keep]], prev_ids[p[keep]]))
+
+
+def stitch(segments, results, iou_threshold=0.5, min_frames=3):
+    """Merges the rows of the segments into one track set with global ids.
+
+    The tracks of a segment matched by :func:`match_overlap` keep the id of the track of the
+    previous segment, and overlapping frames are taken from the earlier segment up to the
+    middle of the overlap. Global ids are numbered from 1 in order of appearance.
+    """
+    merged = []
+    next_id = 0
+    previous_ids = {}
+    for i, ((start, end), rows) in enumerate(zip(segments, results)):
+        ids = {}
+        if i:
+            prev_end = segments[i - 1][1]
+            matches = match_overlap(
+                results[i - 1], rows, start, prev_end, iou_threshold, min_frames
+            )
+            ids = {c: previous_ids[p] for c, p in matches.items()}
+        for track_id in np.unique(rows[:, 1]):
+            if track_id not in ids:
+                ids[track_id] = next_id
+                next_id += 1
+        previous_ids = ids
+        rows = rows.copy()
+        rows[:, 1] = [ids[t] for t in rows[:, 1]]
+        if i:
+            cut = (start + prev_end) // 2
+            merged[-1] = merged[-1][merged[-1][:, 0] < cut]
+            rows = rows[rows[:, 0] >= cut]
+        merged.append(rows)
+    if not merged:
+        return np.empty((0, 6))
+
+    rows = np.concatenate(merged)
+    _, first, inverse = np.unique(rows[:, 1], return_index=True, return_inverse=True)
+    rank = np.empty(len(first), dtype=int)
+    rank[np.argsort(first, kind="stable")] = np.arange(len(first))
+    rows[:, 1] = rank[inverse] + 1
+    return rows
+
+
+def track_video(
+    video,
+    kind,
+    settings,
+    tracker_settings,
+    n_segments=None,
+    overlap=30,
+    warmup=0,
+    workers=None,
+    scheduler_settings=None,
+):
+    """Tracks video in n_segments segments on workers processes, one per CPU by default.
+
+    See :func:`track_segment` for warmup and scheduler_settings. Returns the stitched (M,6)
+    [frame, id, x1, y1, x2, y2] rows, frames numbered from 0.
+    """
+    import cv2
+
+    workers = workers or os.cpu_count() or 1
+    cap = cv2.VideoCapture(video)
+    n_frames = int(cap.get(cv2.CAP_PROP_FRAME_COUNT))
+    cap.release()
+    segments = plan_segments(n_frames, n_segments or workers, overlap)
+    # the last segment reads until the end, as frame counts of some containers are estimates
+    ends = [end for _, end in segments[:-1]] + [None]
+    jobs = [
+        (
+            video,
+            start,
+            end,
+            warmup,
+            kind,
+            settings,
+            tracker_settings,
+            scheduler_settings,
+        )
+        for (start, _), end in zip(segments, ends)
+    ]
+    with concurrent.futures.ProcessPoolExecutor(min(workers, len(jobs))) as pool:
+        results = list(pool.map(track_segment, jobs))
+    return stitch(segments, results)
+
+
+def write_tracks(path, rows, binary=False):
+    """Writes (M,6) [frame, id, x1, y1, x2, y2] rows, frames from 0, as MOT results."""
+    mot_rows = rows.copy()
+    mot_rows[:, 0] += 1
+    mot_rows[:, 4:6] -= mot_rows[:, 2:4]
+    with TrackResultWriter(path, binary, block_rows=max(len(rows), 1)) as writer:
+        writer.add_rows(mot_rows)
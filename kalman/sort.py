@@ -20,18 +20,20 @@ from __future__ import print_function
 
 import argparse
 import glob
+import importlib
 import os
 import time
+from collections import OrderedDict
 
-import matplotlib
-import matplotlib.patches as patches
-import matplotlib.pyplot as plt
 import numpy as np
-from filterpy.kalman import KalmanFilter
-from skimage import io
+from mot_io import MOTDetections, TrackResultWriter
+from stage_timing import TIMINGS
 
-matplotlib.use("TkAgg")
-np.random.seed(0)
+_PREDICT_TIMER = TIMINGS.stage("kalman_predict")
+_IOU_TIMER = TIMINGS.stage("iou")
+_ASSIGNMENT_TIMER = TIMINGS.stage("assignment")
+_UPDATE_TIMER = TIMINGS.stage("kalman_update")
+_MANAGEMENT_TIMER = TIMINGS.stage("track_management")
 
 
 def linear_assignment(cost_matrix):
@@ -42,6 +44,129 @@ def linear_assignment(cost_matrix):
     return np.array(list(zip(x, y)))
 
 
+def hungarian_assignment(score_matrix):
+    """Exact assignment maximising the sum of scores, with the Hungarian algorithm."""
+    return linear_assignment(-score_matrix)
+
+
+def greedy_assignment(score_matrix):
+    """Greedy assignment taking positive scores from the highest down.
+
+    Each pair is kept when both its row and column are still free. Much cheaper than the
+    Hungarian algorithm on crowded frames and identical to it when every row and column has a
+    single clear candidate, it may trade a slightly worse total IOU where boxes compete.
+    Pairs that are the best of both their row and column are accepted together, which gives
+    the same result as visiting the scores one by one in decreasing order.
+    """
+    rows, cols = np.nonzero(score_matrix > 0)
+    return _greedy_pairs(rows, cols, score_matrix[rows, cols])
+
+
+def _greedy_pairs(rows, cols, scores):
+    """Greedy assignment of the candidate pairs (rows[i], cols[i]) scored scores[i] > 0."""
+    order = np.argsort(-scores, kind="stable")
+    rows, cols = rows[order], cols[order]
+    matches = []
+    while len(rows):
+        # the first candidate of its row and of its column cannot be blocked by a better one
+        first = np.zeros(len(rows), dtype=bool)
+        first[np.unique(rows, return_index=True)[1]] = True
+        first_col = np.zeros(len(rows), dtype=bool)
+        first_col[np.unique(cols, return_index=True)[1]] = True
+        first &= first_col
+        matches.append(np.stack((rows[first], cols[first]), axis=1))
+        free = ~(np.isin(rows, rows[first]) | np.isin(cols, cols[first]))
+        rows, cols = rows[free], cols[free]
+    return np.concatenate(matches) if matches else np.empty((0, 2), dtype=int)
+
+
+def auction_assignment(score_matrix, eps=1e-3, time_budget=0.005):
+    """Auction assignment maximising the sum of positive scores within a time budget.
+
+    Rows bid for columns in synchronous rounds (Bertsekas' auction with an unassigned option
+    worth 0), which ends within ``rows * eps`` of the optimal total. If time_budget seconds
+    run out first, the rows still unassigned are completed greedily, trading accuracy for a
+    bounded latency of this call. Callers solving many matrices per frame, like the gated
+    association with one per connected component, spend up to the budget on each.
+    """
+    deadline = time.perf_counter() + time_budget
+    n_rows, n_cols = score_matrix.shape
+    prices = np.zeros(n_cols)
+    owner = np.full(n_cols, -1)
+    assigned = np.full(n_rows, -1)
+    bidders = np.flatnonzero(score_matrix.max(1, initial=0.0) > 0)
+    while len(bidders) and time.perf_counter() < deadline:
+        values = score_matrix[bidders] - prices
+        best = values.argmax(1)
+        best_value = values[np.arange(len(bidders)), best]
+        values[np.arange(len(bidders)), best] = -np.inf
+        second_value = np.maximum(values.max(1, initial=0.0), 0.0)
+        # prices only rise, so rows that have nothing worth bidding for leave for good
+        bidding = best_value > 0
+        bidders, best = bidders[bidding], best[bidding]
+        if not len(bidders):
+            break
+        bids = prices[best] + best_value[bidding] - second_value[bidding] + eps
+
+        # every column goes to its highest bidder
+        order = np.lexsort((bids, best))
+        last = np.append(best[order][1:] != best[order][:-1], True)
+        won_cols, winners = best[order][last], bidders[order][last]
+        outbid = owner[won_cols]
+        assigned[outbid[outbid >= 0]] = -1
+        prices[won_cols] = bids[order][last]
+        owner[won_cols] = winners
+        assigned[winners] = won_cols
+        bidders = bidders[assigned[bidders] < 0]
+        bidders = np.concatenate((bidders, outbid[outbid >= 0]))
+
+    rows = np.flatnonzero(assigned >= 0)
+    matches = np.stack((rows, assigned[rows]), axis=1)
+    free_rows, free_cols = assigned < 0, owner < 0
+    if free_rows.any() and free_cols.any():
+        rest = greedy_assignment(score_matrix[np.ix_(free_rows, free_cols)])
+        rest = np.stack(
+            (
+                np.flatnonzero(free_rows)[rest[:, 0]],
+                np.flatnonzero(free_cols)[rest[:, 1]],
+            ),
+            axis=1,
+        )
+        matches = np.concatenate((matches, rest))
+    return matches
+
+
+# Solvers of the competing candidates. Measured with benchmark_sort.py over the 39
+# consecutive frame pairs of crowded scenes, against the exact hungarian matches:
+#
+#   scene (objects, area_per_object)  solver   matched IOU  matches kept  pairs differing
+#   1000, 4000                        greedy   99.99%       99.94%        8/39
+#   1000, 4000                        auction  99.98%       99.94%        15/39
+#   300, 1500                         greedy   99.98%       99.70%        14/39
+#   300, 1500                         auction  100%         100%          0/39
+#
+# The dense 1000 x 1000 IOU matrix is solved in about 8 ms by hungarian and 5 ms by greedy
+# or auction. The gated BatchSort update takes 33 ms with hungarian, 22 ms with greedy and
+# 50 ms with auction, which pays its per-call overhead on each connected component.
+ASSIGNMENT_SOLVERS = {
+    "hungarian": hungarian_assignment,
+    "greedy": greedy_assignment,
+    "auction": auction_assignment,
+}
+
+
+def get_assignment_solver(assignment):
+    """Returns the solver named assignment in ASSIGNMENT_SOLVERS, or assignment if callable."""
+    if callable(assignment):
+        return assignment
+    if assignment not in ASSIGNMENT_SOLVERS:
+        raise ValueError(
+            "Unknown assignment %r, expected one of %s"
+            % (assignment, ", ".join(sorted(ASSIGNMENT_SOLVERS)))
+        )
+    return ASSIGNMENT_SOLVERS[assignment]
+
+
 def iou_batch(bb_test, bb_gt):
     """From SORT: Computes IOU between two bboxes in the form [x1,y1,x2,y2]."""
     bb_gt = np.expand_dims(bb_gt, 0)
@@ -87,13 +212,102 @@ def convert_x_to_bbox(x, score=None):
         ).reshape((1, 5))
 
 
+class _GainNode(object):
+    """Covariance reached after a given hit/miss history, with the gain that led to it."""
+
+    __slots__ = ("node_id", "depth", "P", "K")
+
+    def __init__(self, node_id, depth, P, K):
+        """Stores the node, freezing its arrays since they are shared between trackers."""
+        P.flags.writeable = False
+        if K is not None:
+            K.flags.writeable = False
+        self.node_id = node_id
+        self.depth = depth
+        self.P = P
+        self.K = K
+
+
+class KalmanGainCache(object):
+    """Memoizes the covariance recursion of :class:`KalmanBoxTracker`.
+
+    Every tracker starts from the same P, Q and R, so its covariance and Kalman gain only depend
+    on the sequence of predict and update steps it went through, not on the measured boxes.
+    The cache stores that recursion as a tree of :class:`_GainNode` keyed by (parent, step)
+    and evicts the least recently used entries once it holds more than max_entries of them.
+    Trackers older than max_depth steps fall back to the full filter. A cache must only be
+    shared by trackers that use the same model.
+    """
+
+    def __init__(self, max_depth=64, max_entries=4096):
+        """Sets the bounds of the cache."""
+        self.max_depth = max_depth
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._root = None
+        self._next_id = 0
+        self._entries = OrderedDict()
+
+    def __len__(self):
+        """Number of memoized steps."""
+        return len(self._entries)
+
+    def _node(self, depth, P, K=None):
+        """Creates a node with a fresh id."""
+        self._next_id += 1
+        return _GainNode(self._next_id, depth, P, K)
+
+    def root(self, kf):
+        """Returns the node holding the initial covariance of kf."""
+        if self._root is None:
+            self._root = self._node(0, kf.P.copy())
+        return self._root
+
+    def step(self, node, kf, update):
+        """Returns the node reached from node by a predict or an update step of kf.
+
+        Returns None when node is already max_depth steps deep.
+        """
+        if node.depth >= self.max_depth:
+            return None
+        key = (node.node_id, update)
+        child = self._entries.get(key)
+        if child is not None:
+            self.hits += 1
+            self._entries.move_to_end(key)
+            return child
+
+        self.misses += 1
+        if update:
+            # same operations as filterpy.kalman.KalmanFilter.update
+            PHT = np.dot(node.P, kf.H.T)
+            K = np.dot(PHT, kf.inv(np.dot(kf.H, PHT) + kf.R))
+            I_KH = kf._I - np.dot(K, kf.H)
+            P = np.dot(np.dot(I_KH, node.P), I_KH.T) + np.dot(np.dot(K, kf.R), K.T)
+            child = self._node(node.depth + 1, P, K)
+        else:
+            P = kf._alpha_sq * np.dot(np.dot(kf.F, node.P), kf.F.T) + kf.Q
+            child = self._node(node.depth + 1, P)
+        self._entries[key] = child
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return child
+
+
 class KalmanBoxTracker(object):
     """This class represents the internal state of individual tracked objects observed as bbox."""
 
     count = 0
 
-    def __init__(self, bbox):
-        """Initialises a tracker using initial bounding box."""
+    def __init__(self, bbox, gain_cache=None):
+        """Initialises a tracker using initial bounding box.
+
+        With a :class:`KalmanGainCache`, covariances and gains are looked up in the cache and
+        the tracker only updates its state vector.
+        """
+        from filterpy.kalman import KalmanFilter
+
         # define constant velocity model
         self.kf = KalmanFilter(dim_x=7, dim_z=4)
         self.kf.F = np.array(
@@ -125,6 +339,8 @@ class KalmanBoxTracker(object):
         self.kf.Q[4:, 4:] *= 0.01
 
         self.kf.x[:4] = convert_bbox_to_z(bbox)
+        self.gain_cache = gain_cache
+        self._gain_node = None if gain_cache is None else gain_cache.root(self.kf)
         self.time_since_update = 0
         self.id = KalmanBoxTracker.count
         KalmanBoxTracker.count += 1
@@ -139,17 +355,32 @@ class KalmanBoxTracker(object):
         self.history = []
         self.hits += 1
         self.hit_streak += 1
-        self.kf.update(convert_bbox_to_z(bbox))
+        if self._step_gain_node(update=True):
+            kf = self.kf
+            kf.x = kf.x + np.dot(
+                self._gain_node.K, convert_bbox_to_z(bbox) - np.dot(kf.H, kf.x)
+            )
+            kf.P = self._gain_node.P
+        else:
+            self.kf.update(convert_bbox_to_z(bbox))
 
-    def predict(self):
-        """Advances the state vector and returns the predicted bounding box estimate."""
+    def predict(self, coast=False):
+        """Advances the state vector and returns the predicted bounding box estimate.
+
+        A coasting step, on a frame without detector output, does not count as a miss.
+        """
         if (self.kf.x[6] + self.kf.x[2]) <= 0:
             self.kf.x[6] *= 0.0
-        self.kf.predict()
+        if self._step_gain_node(update=False):
+            self.kf.x = np.dot(self.kf.F, self.kf.x)
+            self.kf.P = self._gain_node.P
+        else:
+            self.kf.predict()
         self.age += 1
-        if self.time_since_update > 0:
-            self.hit_streak = 0
-        self.time_since_update += 1
+        if not coast:
+            if self.time_since_update > 0:
+                self.hit_streak = 0
+            self.time_since_update += 1
         self.history.append(convert_x_to_bbox(self.kf.x))
         return self.history[-1]
 
@@ -157,9 +388,26 @@ class KalmanBoxTracker(object):
         """Returns the current bounding box estimate."""
         return convert_x_to_bbox(self.kf.x)
 
+    def _step_gain_node(self, update):
+        """Advances the cached covariance, returns False when the full filter must be run."""
+        if self._gain_node is None:
+            return False
+        self._gain_node = self.gain_cache.step(self._gain_node, self.kf, update)
+        if self._gain_node is None:
+            # past the cached depth, the filter continues from a private covariance
+            self.kf.P = self.kf.P.copy()
+            return False
+        return True
 
-def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
-    """Assigns detections to tracked object (both represented as bounding boxes)."""
+
+def associate_detections_to_trackers(
+    detections, trackers, iou_threshold=0.3, assignment="hungarian"
+):
+    """Assigns detections to tracked object (both represented as bounding boxes).
+
+    assignment names the solver of ASSIGNMENT_SOLVERS used when candidates compete, or is a
+    callable returning the (K,2) assigned pairs of an IOU matrix.
+    """
     if len(trackers) == 0 or len(detections) == 0:
         return (
             np.empty((0, 2), dtype=int),
@@ -167,80 +415,365 @@ def associate_detections_to_trackers(detections, trackers, iou_threshold=0.3):
             np.empty((0, 5), dtype=int),
         )
 
-    iou_matrix = iou_batch(detections, trackers)
+    with _IOU_TIMER:
+        iou_matrix = iou_batch(detections, trackers)
 
-    if min(iou_matrix.shape) > 0:
+    with _ASSIGNMENT_TIMER:
         a = (iou_matrix > iou_threshold).astype(np.int32)
         if a.sum(1).max() == 1 and a.sum(0).max() == 1:
             matched_indices = np.stack(np.where(a), axis=1)
         else:
-            matched_indices = linear_assignment(-iou_matrix)
-    else:
-        matched_indices = np.empty(shape=(0, 2))
-
-    unmatched_detections = []
-    for d, det in enumerate(detections):
-        if d not in matched_indices[:, 0]:
-            unmatched_detections.append(d)
-    unmatched_trackers = []
-    for t, trk in enumerate(trackers):
-        if t not in matched_indices[:, 1]:
-            unmatched_trackers.append(t)
-
-    # filter out matched with low IOU
-    matches = []
-    for m in matched_indices:
-        if iou_matrix[m[0], m[1]] < iou_threshold:
-            unmatched_detections.append(m[0])
-            unmatched_trackers.append(m[1])
+            matched_indices = get_assignment_solver(assignment)(iou_matrix)
+        # solver callables may return an empty, flat or float array
+        matched_indices = np.asarray(matched_indices, dtype=int).reshape(-1, 2)
+
+    return _split_matches(
+        matched_indices,
+        iou_matrix[matched_indices[:, 0], matched_indices[:, 1]] >= iou_threshold,
+        len(detections),
+        len(trackers),
+    )
+
+
+def _split_matches(matched_indices, accepted, n_detections, n_trackers):
+    """Splits candidate (detection, tracker) pairs into matches and unmatched indices.
+
+    Rows and columns left out of matched_indices come first, followed by the pairs rejected
+    through the accepted mask.
+    """
+    rejected = matched_indices[~accepted]
+    free_detections = np.ones(n_detections, dtype=bool)
+    free_detections[matched_indices[:, 0]] = False
+    free_trackers = np.ones(n_trackers, dtype=bool)
+    free_trackers[matched_indices[:, 1]] = False
+    unmatched_detections = np.concatenate(
+        (np.flatnonzero(free_detections), rejected[:, 0])
+    )
+    unmatched_trackers = np.concatenate((np.flatnonzero(free_trackers), rejected[:, 1]))
+    return matched_indices[accepted], unmatched_detections, unmatched_trackers
+
+
+def iou_pairs(bb_test, bb_gt):
+    """Computes IOU between aligned rows of two arrays of bboxes in the form [x1,y1,x2,y2]."""
+    xx1 = np.maximum(bb_test[:, 0], bb_gt[:, 0])
+    yy1 = np.maximum(bb_test[:, 1], bb_gt[:, 1])
+    xx2 = np.minimum(bb_test[:, 2], bb_gt[:, 2])
+    yy2 = np.minimum(bb_test[:, 3], bb_gt[:, 3])
+    wh = np.maximum(0.0, xx2 - xx1) * np.maximum(0.0, yy2 - yy1)
+    return wh / (
+        (bb_test[:, 2] - bb_test[:, 0]) * (bb_test[:, 3] - bb_test[:, 1])
+        + (bb_gt[:, 2] - bb_gt[:, 0]) * (bb_gt[:, 3] - bb_gt[:, 1])
+        - wh
+    )
+
+
+def overlapping_pairs(
+    bb_test, bb_gt, test_groups=None, gt_groups=None, outlier_quantile=0.95
+):
+    """Finds every pair of overlapping boxes with a sorted interval sweep.
+
+    bb_gt is sorted once along the axis where boxes are most spread out, so each box of
+    bb_test only visits the window of bb_gt boxes whose start lies in its own span widened
+    by the outlier_quantile of the bb_gt extents. The few bb_gt boxes larger than that, like
+    a diverged track, are swept the other way round over bb_test, so that they do not widen
+    every window back to a dense scan. With non-negative integer test_groups and gt_groups,
+    only boxes of the same group are paired: groups are laid out side by side along the
+    sweep axis. Returns the aligned (test, gt) index arrays.
+    """
+    extent = bb_gt[:, 2:4] - bb_gt[:, 0:2]
+    width = np.maximum(np.quantile(extent, outlier_quantile, axis=0), 1e-9)
+    span = np.maximum(bb_gt[:, 2:4].max(0), bb_test[:, 2:4].max(0)) - np.minimum(
+        bb_gt[:, 0:2].min(0), bb_test[:, 0:2].min(0)
+    )
+    axis = int(np.argmax(span / width))
+
+    large = extent[:, axis] > width[axis]
+    if not large.any():
+        return _sweep_pairs(
+            bb_test, bb_gt, test_groups, gt_groups, axis, width[axis], span[axis]
+        )
+    small, large = np.flatnonzero(~large), np.flatnonzero(large)
+    test_idx, gt_idx = _sweep_pairs(
+        bb_test,
+        bb_gt[small],
+        test_groups,
+        None if gt_groups is None else gt_groups[small],
+        axis,
+        width[axis],
+        span[axis],
+    )
+    large_idx, large_test_idx = overlapping_pairs(
+        bb_gt[large],
+        bb_test,
+        None if gt_groups is None else gt_groups[large],
+        test_groups,
+        outlier_quantile,
+    )
+    return (
+        np.concatenate((test_idx, large_test_idx)),
+        np.concatenate((small[gt_idx], large[large_idx])),
+    )
+
+
+def _sweep_pairs(bb_test, bb_gt, test_groups, gt_groups, axis, width, span):
+    """Pairs the overlapping boxes by a sweep along axis, no bb_gt box longer than width."""
+    starts = bb_gt[:, axis]
+    lows = bb_test[:, axis] - width
+    highs = bb_test[:, axis + 2]
+    if test_groups is not None:
+        stride = span + 2.0 * width + 1.0
+        starts = starts + gt_groups * stride
+        lows = lows + test_groups * stride
+        highs = highs + test_groups * stride
+        # the offsets may round the bounds, the exact overlap test below drops extra pairs
+        slack = 1e-9 * np.abs(np.concatenate((starts, lows, highs))).max()
+        lows -= slack
+        highs += slack
+
+    order = np.argsort(starts, kind="stable")
+    lo = np.searchsorted(starts[order], lows, side="left")
+    hi = np.searchsorted(starts[order], highs, side="left")
+    counts = np.maximum(hi - lo, 0)
+
+    test_idx = np.repeat(np.arange(len(bb_test)), counts)
+    window_offset = np.arange(counts.sum()) - np.repeat(
+        np.cumsum(counts) - counts, counts
+    )
+    gt_idx = order[np.repeat(lo, counts) + window_offset]
+
+    a, b = bb_test[test_idx], bb_gt[gt_idx]
+    overlap = (
+        (a[:, 0] < b[:, 2])
+        & (b[:, 0] < a[:, 2])
+        & (a[:, 1] < b[:, 3])
+        & (b[:, 1] < a[:, 3])
+    )
+    if test_groups is not None:
+        overlap &= test_groups[test_idx] == gt_groups[gt_idx]
+    return test_idx[overlap], gt_idx[overlap]
+
+
+def associate_detections_to_trackers_gated(
+    detections,
+    trackers,
+    iou_threshold=0.3,
+    det_groups=None,
+    trk_groups=None,
+    assignment="hungarian",
+):
+    """Assigns detections to tracked object, only scoring pairs of overlapping boxes.
+
+    IOU is computed for the overlapping pairs found by :func:`overlapping_pairs`, restricted
+    to the same group when det_groups and trk_groups are given, and pairs below
+    iou_threshold are gated out. The remaining bipartite graph is split into connected
+    components: components made of a single pair are matched directly and each larger one is
+    solved on its own by the assignment solver, the Hungarian algorithm by default. The
+    greedy solver runs once over all the gated pairs instead. Returns the same triple as
+    :func:`associate_detections_to_trackers`.
+    """
+    n_dets, n_trks = len(detections), len(trackers)
+    if n_trks == 0 or n_dets == 0:
+        return (
+            np.empty((0, 2), dtype=int),
+            np.arange(n_dets),
+            np.empty((0, 5), dtype=int),
+        )
+
+    with _IOU_TIMER:
+        d_idx, t_idx = overlapping_pairs(detections, trackers, det_groups, trk_groups)
+        iou = iou_pairs(detections[d_idx], trackers[t_idx])
+        gate = (iou >= iou_threshold) & (iou > 0)
+        d_idx, t_idx, iou = d_idx[gate], t_idx[gate], iou[gate]
+
+    with _ASSIGNMENT_TIMER:
+        solver = get_assignment_solver(assignment)
+        if solver is greedy_assignment:
+            # greedy matching is the same whether or not it is split into components
+            matched_indices = _greedy_pairs(d_idx, t_idx, iou)
         else:
-            matches.append(m.reshape(1, 2))
-    if len(matches) == 0:
-        matches = np.empty((0, 2), dtype=int)
-    else:
-        matches = np.concatenate(matches, axis=0)
+            matched_indices = _solve_components(
+                d_idx, t_idx, iou, n_dets, n_trks, solver
+            )
+
+    return _split_matches(
+        matched_indices,
+        np.ones(len(matched_indices), dtype=bool),
+        n_dets,
+        n_trks,
+    )
 
-    return matches, np.array(unmatched_detections), np.array(unmatched_trackers)
+
+def _solve_components(d_idx, t_idx, iou, n_dets, n_trks, solver):
+    """Assigns the gated pairs one connected component of the candidate graph at a time."""
+    from scipy.sparse import coo_matrix
+    from scipy.sparse.csgraph import connected_components
+
+    graph = coo_matrix(
+        (np.ones(len(d_idx)), (d_idx, n_dets + t_idx)), shape=(n_dets + n_trks,) * 2
+    )
+    n_components, labels = connected_components(graph, directed=False)
+    det_count = np.bincount(labels[:n_dets], minlength=n_components)
+    trk_count = np.bincount(labels[n_dets:], minlength=n_components)
+    edge_component = labels[d_idx]
+    single = (det_count[edge_component] == 1) & (trk_count[edge_component] == 1)
+
+    matches = [np.stack((d_idx[single], t_idx[single]), axis=1)]
+    rest = np.flatnonzero(~single)
+    rest = rest[np.argsort(edge_component[rest], kind="stable")]
+    bounds = np.flatnonzero(np.diff(edge_component[rest])) + 1
+    for edges in np.split(rest, bounds) if len(rest) else []:
+        rows, local_d = np.unique(d_idx[edges], return_inverse=True)
+        cols, local_t = np.unique(t_idx[edges], return_inverse=True)
+        sub_iou = np.zeros((len(rows), len(cols)))
+        sub_iou[local_d, local_t] = iou[edges]
+        x, y = solver(sub_iou).reshape(-1, 2).T
+        # the solver may pad the assignment with pairs that were gated out
+        kept = sub_iou[x, y] > 0
+        matches.append(np.stack((rows[x[kept]], cols[y[kept]]), axis=1))
+    return np.concatenate(matches)
 
 
 class Sort(object):
     """SORT."""
 
-    def __init__(self, max_age=30, min_hits=3, iou_threshold=0.3):
-        """Sets key parameters for SORT."""
+    def __init__(
+        self,
+        max_age=30,
+        min_hits=3,
+        iou_threshold=0.3,
+        gated=False,
+        gain_cache=None,
+        assignment="hungarian",
+    ):
+        """Sets key parameters for SORT.
+
+        With gated set, detections are associated with
+        :func:`associate_detections_to_trackers_gated`, which scales close to linearly on
+        crowded frames. A :class:`KalmanGainCache` given as gain_cache is shared by all the
+        trackers. assignment selects how competing candidates are matched, or is a solver
+        callable:
+
+        * "hungarian": exact, the default.
+        * "greedy": highest IOU first, the fastest on crowded frames. Where boxes compete it
+          keeps a slightly lower total IOU, and its matches differ from hungarian on 20 to
+          36% of the consecutive frame pairs of crowded scenes.
+        * "auction": near optimal, then completed greedily once its time_budget runs out.
+          The budget applies per solver call, and gated trackers call the solver once per
+          connected component, so it does not bound the latency of a frame. Gated trackers
+          are slower with it than with hungarian.
+
+        See ASSIGNMENT_SOLVERS for measured accuracy and timings.
+        """
         self.max_age = max_age
         self.min_hits = min_hits
         self.iou_threshold = iou_threshold
+        self.gated = gated
+        self.assignment = get_assignment_solver(assignment)
+        self.gain_cache = gain_cache
         self.trackers = []
         self.frame_count = 0
+        self.created = 0
+
+    # modules the tracks import when the first one is created, see preload
+    lazy_modules = ("filterpy.kalman",)
+
+    def preload(self):
+        """Imports the modules the first updates load lazily, so that no frame stalls on them."""
+        modules = list(self.lazy_modules)
+        if self.assignment is hungarian_assignment:
+            modules.append("scipy.optimize")
+        if self.gated:
+            modules.append("scipy.sparse.csgraph")
+        for name in modules:
+            importlib.import_module(name)
 
     def update(self, dets=np.empty((0, 5))):
         """The number of objects returned may differ from the number of detections provided."""
         self.frame_count += 1
         # get predicted locations from existing trackers.
+        with _PREDICT_TIMER:
+            trks = self._predict()
+        matched, unmatched_dets, unmatched_trks = self._associate(dets, trks)
+        self.created += len(unmatched_dets)
+
+        # update matched trackers with assigned detections
+        with _UPDATE_TIMER:
+            self._update_matched(dets, matched)
+
+        # create and initialise new trackers for unmatched detections
+        with _MANAGEMENT_TIMER:
+            self._create_trackers(dets, unmatched_dets)
+            return self._collect_and_prune()
+
+    def predict(self):
+        """Advances the tracks by one frame on which the detector did not run.
+
+        Unlike an ``update`` without detections, such a coasting frame is not a miss: tracks
+        keep their hit streak and only frames with detector output age them towards max_age.
+        Returns the predicted boxes of the confirmed tracks, like ``update``.
+        """
+        self.frame_count += 1
+        with _PREDICT_TIMER:
+            self._predict(coast=True)
+        with _MANAGEMENT_TIMER:
+            return self._collect_and_prune()
+
+    def track_boxes(self):
+        """Returns the (N,4) current [x1,y1,x2,y2] estimates of every live track."""
+        return np.array([trk.get_state()[0] for trk in self.trackers]).reshape(-1, 4)
+
+    def track_velocities(self):
+        """Returns the (N,2) per-frame velocity of the centre of every live track."""
+        return np.array([trk.kf.x[4:6, 0] for trk in self.trackers]).reshape(-1, 2)
+
+    def position_uncertainty(self):
+        """Returns the standard deviation in pixels of the centre of the tracks seen last."""
+        return np.array(
+            [
+                np.sqrt(trk.kf.P[0, 0] + trk.kf.P[1, 1])
+                for trk in self.trackers
+                if trk.time_since_update < 1
+            ]
+        )
+
+    def _predict(self, coast=False):
+        """Predicts every tracker and drops the ones whose prediction is invalid."""
         trks = np.zeros((len(self.trackers), 5))
         to_del = []
-        ret = []
         for t, trk in enumerate(trks):
-            pos = self.trackers[t].predict()[0]
+            pos = self.trackers[t].predict(coast)[0]
             trk[:] = [pos[0], pos[1], pos[2], pos[3], 0]
             if np.any(np.isnan(pos)):
                 to_del.append(t)
         trks = np.ma.compress_rows(np.ma.masked_invalid(trks))
         for t in reversed(to_del):
             self.trackers.pop(t)
-        matched, unmatched_dets, unmatched_trks = associate_detections_to_trackers(
-            dets, trks, self.iou_threshold
+        return trks
+
+    def _associate(self, dets, trks):
+        """Assigns detections to the predicted tracker boxes."""
+        if self.gated:
+            return associate_detections_to_trackers_gated(
+                dets, trks, self.iou_threshold, assignment=self.assignment
+            )
+        return associate_detections_to_trackers(
+            dets, trks, self.iou_threshold, self.assignment
         )
 
-        # update matched trackers with assigned detections
+    def _update_matched(self, dets, matched):
+        """Updates matched trackers with their assigned detections."""
         for m in matched:
             self.trackers[m[1]].update(dets[m[0], :])
 
-        # create and initialise new trackers for unmatched detections
+    def _create_trackers(self, dets, unmatched_dets):
+        """Creates and initialises new trackers for unmatched detections."""
         for i in unmatched_dets:
-            trk = KalmanBoxTracker(dets[i, :])
+            trk = KalmanBoxTracker(dets[i, :], self.gain_cache)
             self.trackers.append(trk)
+
+    def _collect_and_prune(self):
+        """Returns the confirmed tracks and removes the dead ones."""
+        ret = []
         i = len(self.trackers)
         for trk in reversed(self.trackers):
             d = trk.get_state()[0]
@@ -259,6 +792,198 @@ class Sort(object):
         return np.empty((0, 5))
 
 
+def convert_bboxes_to_z(bboxes):
+    """Takes an (N,4+) array of [x1,y1,x2,y2] boxes and returns the (N,4) [x,y,s,r] states."""
+    w = bboxes[:, 2] - bboxes[:, 0]
+    h = bboxes[:, 3] - bboxes[:, 1]
+    return np.stack(
+        [bboxes[:, 0] + w / 2.0, bboxes[:, 1] + h / 2.0, w * h, w / h], axis=1
+    )
+
+
+def convert_xs_to_bboxes(xs):
+    """Takes an (N,4+) array of centre form states and returns the (N,4) [x1,y1,x2,y2] boxes."""
+    w = np.sqrt(xs[:, 2] * xs[:, 3])
+    h = xs[:, 2] / w
+    return np.stack(
+        [
+            xs[:, 0] - w / 2.0,
+            xs[:, 1] - h / 2.0,
+            xs[:, 0] + w / 2.0,
+            xs[:, 1] + h / 2.0,
+        ],
+        axis=1,
+    )
+
+
+class KalmanBoxBank(object):
+    """Constant velocity Kalman filters of many tracked boxes stored as stacked arrays.
+
+    Row ``i`` of ``x`` (N,7) and ``P`` (N,7,7) is the state of the i-th track, rows are kept in
+    creation order. The model is the same as :class:`KalmanBoxTracker`.
+    """
+
+    F = np.eye(7) + np.eye(7, k=4)
+    Q = np.diag([1.0, 1.0, 1.0, 1.0, 0.01, 0.01, 0.0001])
+    R = np.diag([1.0, 1.0, 10.0, 10.0])
+    P0 = np.diag([10.0, 10.0, 10.0, 10.0, 10000.0, 10000.0, 10000.0])
+
+    def __init__(self):
+        """Initialises an empty bank."""
+        self.x = np.zeros((0, 7))
+        self.P = np.zeros((0, 7, 7))
+        self.ids = np.zeros(0, dtype=int)
+        self.time_since_update = np.zeros(0, dtype=int)
+        self.hits = np.zeros(0, dtype=int)
+        self.hit_streak = np.zeros(0, dtype=int)
+        self.age = np.zeros(0, dtype=int)
+
+    def __len__(self):
+        """Number of tracks in the bank."""
+        return len(self.x)
+
+    def add(self, bboxes, ids=None):
+        """Appends one new track per [x1,y1,x2,y2] row of bboxes.
+
+        Tracks are numbered with KalmanBoxTracker.count unless their ids are given.
+        """
+        n = len(bboxes)
+        x = np.zeros((n, 7))
+        x[:, :4] = convert_bboxes_to_z(bboxes)
+        self.x = np.concatenate((self.x, x))
+        self.P = np.concatenate((self.P, np.broadcast_to(self.P0, (n, 7, 7))))
+        if ids is None:
+            ids = np.arange(KalmanBoxTracker.count, KalmanBoxTracker.count + n)
+            KalmanBoxTracker.count += n
+        self.ids = np.concatenate((self.ids, ids))
+        zeros = np.zeros(n, dtype=int)
+        self.time_since_update = np.concatenate((self.time_since_update, zeros))
+        self.hits = np.concatenate((self.hits, zeros))
+        self.hit_streak = np.concatenate((self.hit_streak, zeros))
+        self.age = np.concatenate((self.age, zeros))
+
+    def keep(self, mask):
+        """Keeps only the tracks selected by the boolean mask."""
+        self.x = self.x[mask]
+        self.P = self.P[mask]
+        self.ids = self.ids[mask]
+        self.time_since_update = self.time_since_update[mask]
+        self.hits = self.hits[mask]
+        self.hit_streak = self.hit_streak[mask]
+        self.age = self.age[mask]
+
+    def predict(self, idx=None, coast=False):
+        """Advances the state vectors and returns the (N,4) predicted bounding boxes.
+
+        Every track is advanced unless the indices of a subset are given as idx. Coasting
+        steps, on frames without detector output, do not count as misses.
+        """
+        if idx is None:
+            idx = slice(None)
+        x = self.x[idx]
+        x[x[:, 6] + x[:, 2] <= 0, 6] *= 0.0
+        self.x[idx] = x @ self.F.T
+        self.P[idx] = self.F @ self.P[idx] @ self.F.T + self.Q
+        self.age[idx] += 1
+        if not coast:
+            hit_streak = self.hit_streak[idx]
+            hit_streak[self.time_since_update[idx] > 0] = 0
+            self.hit_streak[idx] = hit_streak
+            self.time_since_update[idx] += 1
+        return convert_xs_to_bboxes(self.x[idx])
+
+    def update(self, idx, bboxes):
+        """Updates the tracks at idx with their observed [x1,y1,x2,y2] bboxes."""
+        P = self.P[idx]
+        # H only selects the first four state entries, so H.P.H' and P.H' are slices of P
+        PHT = P[:, :, :4]
+        K = PHT @ np.linalg.inv(P[:, :4, :4] + self.R)
+        y = convert_bboxes_to_z(bboxes) - self.x[idx, :4]
+        self.x[idx] += (K @ y[:, :, None])[:, :, 0]
+        I_KH = np.broadcast_to(np.eye(7), P.shape).copy()
+        I_KH[:, :, :4] -= K
+        self.P[idx] = I_KH @ P @ I_KH.transpose(0, 2, 1) + K @ self.R @ K.transpose(
+            0, 2, 1
+        )
+        self.time_since_update[idx] = 0
+        self.hits[idx] += 1
+        self.hit_streak[idx] += 1
+
+    def get_state(self):
+        """Returns the (N,4) current bounding box estimates."""
+        return convert_xs_to_bboxes(self.x)
+
+
+class BatchSort(Sort):
+    """SORT whose tracks live in a :class:`KalmanBoxBank`.
+
+    Every track is predicted in one batched operation and all matched tracks are updated in
+    another one. The output is the same as :class:`Sort`, so it can be used in its place.
+    """
+
+    lazy_modules = ()  # the bank needs no filterpy
+
+    def __init__(
+        self,
+        max_age=30,
+        min_hits=3,
+        iou_threshold=0.3,
+        gated=False,
+        assignment="hungarian",
+    ):
+        """Sets key parameters for SORT."""
+        super(BatchSort, self).__init__(
+            max_age, min_hits, iou_threshold, gated, assignment=assignment
+        )
+        self.bank = KalmanBoxBank()
+
+    def track_boxes(self):
+        """Returns the (N,4) current [x1,y1,x2,y2] estimates of every live track."""
+        return self.bank.get_state()
+
+    def track_velocities(self):
+        """Returns the (N,2) per-frame velocity of the centre of every live track."""
+        return self.bank.x[:, 4:6].copy()
+
+    def position_uncertainty(self):
+        """Returns the standard deviation in pixels of the centre of the tracks seen last."""
+        P = self.bank.P[self.bank.time_since_update < 1]
+        return np.sqrt(P[:, 0, 0] + P[:, 1, 1])
+
+    def _predict(self, coast=False):
+        """Predicts every track and drops the ones whose prediction is invalid."""
+        pos = self.bank.predict(coast=coast)
+        valid = ~np.any(np.isnan(pos), axis=1)
+        if not valid.all():
+            self.bank.keep(valid)
+            pos = pos[valid]
+        return np.concatenate((pos, np.zeros((len(pos), 1))), axis=1)
+
+    def _update_matched(self, dets, matched):
+        """Updates matched tracks with their assigned detections."""
+        if len(matched) > 0:
+            self.bank.update(matched[:, 1], dets[matched[:, 0], :4])
+
+    def _create_trackers(self, dets, unmatched_dets):
+        """Creates and initialises new tracks for unmatched detections."""
+        if len(unmatched_dets) > 0:
+            self.bank.add(dets[unmatched_dets, :4])
+
+    def _collect_and_prune(self):
+        """Returns the confirmed tracks and removes the dead ones."""
+        bank = self.bank
+        confirmed = (bank.time_since_update < 1) & (
+            (bank.hit_streak >= self.min_hits) | (self.frame_count <= self.min_hits)
+        )
+        # Sort reports the most recently created tracks first
+        confirmed = np.flatnonzero(confirmed)[::-1]
+        ret = np.concatenate(
+            (bank.get_state()[confirmed], bank.ids[confirmed, None] + 1.0), axis=1
+        )  # +1 as MOT benchmark requires positive
+        bank.keep(bank.time_since_update <= self.max_age)
+        return ret
+
+
 def parse_args():
     """Parse input arguments."""
     parser = argparse.ArgumentParser(description="SORT demo")
@@ -289,10 +1014,173 @@ def parse_args():
     parser.add_argument(
         "--iou_threshold", help="Minimum IOU for match.", type=float, default=0.3
     )
+    parser.add_argument(
+        "--gated",
+        help="Only score overlapping boxes and solve each connected component on its own "
+        "[False]",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--assignment",
+        help="How competing detections and tracks are matched [hungarian]",
+        choices=sorted(ASSIGNMENT_SOLVERS),
+        default="hungarian",
+    )
+    parser.add_argument(
+        "--cached_gains",
+        help="Memoize covariances and Kalman gains per hit/miss history, not used with "
+        "--batched [False]",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--batched",
+        help="Keep all tracks in one vectorized Kalman bank [False]",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--no_det_cache",
+        help="Do not read or write the binary det.npy cache next to det.txt [False]",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--binary_output",
+        help="Write output/<seq>.trk binary track records instead of MOT text [False]",
+        action="store_true",
+    )
+    parser.add_argument(
+        "--workers",
+        help="Number of sequences tracked in parallel, 0 for one per core [1]",
+        type=int,
+        default=1,
+    )
+    parser.add_argument(
+        "--order",
+        help="Order in which sequences are dispatched [size]",
+        choices=["size", "name"],
+        default="size",
+    )
+    parser.add_argument(
+        "--timings",
+        help="Time the stages into output/<seq>.timings.json or .prom histograms",
+        choices=["json", "prom"],
+    )
+    parser.add_argument(
+        "--timings_interval",
+        help="Seconds between two exports of the timings [10]",
+        type=float,
+        default=10.0,
+    )
     args = parser.parse_args()
     return args
 
 
+def track_sequence(seq_dets_fn, seq, args, view=None):
+    """Tracks one MOT sequence, writes output/<seq>.txt and returns (seq, frames, seconds).
+
+    view is the (figure, axes, colours) triple used to display the tracks, if any.
+    """
+    if view:
+        import matplotlib.patches as patches
+        import matplotlib.pyplot as plt
+        from skimage import io
+
+    tracker_kwargs = {}
+    if args.cached_gains and not args.batched:
+        tracker_kwargs["gain_cache"] = KalmanGainCache()
+    tracker_class = BatchSort if args.batched else Sort
+    # number tracks from 1 in every sequence, whichever process tracks it
+    KalmanBoxTracker.count = 0
+    mot_tracker = tracker_class(
+        max_age=args.max_age,
+        min_hits=args.min_hits,
+        iou_threshold=args.iou_threshold,
+        gated=args.gated,
+        assignment=args.assignment,
+        **tracker_kwargs
+    )  # create instance of the SORT tracker
+    seq_dets = MOTDetections(seq_dets_fn, use_cache=not args.no_det_cache)
+    total_time = 0.0
+    total_frames = 0
+
+    out_fn = os.path.join(
+        "output", "%s.%s" % (seq, "trk" if args.binary_output else "txt")
+    )
+    if args.timings:
+        TIMINGS.reset()
+        TIMINGS.enable(
+            os.path.join("output", "%s.timings.%s" % (seq, args.timings)),
+            args.timings_interval,
+        )
+    output_timer = TIMINGS.stage("output")
+    with TrackResultWriter(out_fn, binary=args.binary_output) as out_file:
+        print("Processing %s." % (seq))
+        for frame, dets in seq_dets:  # detection and frame numbers begin at 1
+            total_frames += 1
+
+            if view:
+                fig, ax1, colours = view
+                fn = os.path.join(
+                    "mot_benchmark", args.phase, seq, "img1", "%06d.jpg" % (frame)
+                )
+                im = io.imread(fn)
+                ax1.imshow(im)
+                plt.title(seq + " Tracked Targets")
+
+            start_time = time.time()
+            trackers = mot_tracker.update(dets)
+            cycle_time = time.time() - start_time
+            total_time += cycle_time
+
+            with output_timer:
+                out_file.add(frame, trackers)
+            TIMINGS.tick()
+            if view:
+                for d in trackers:
+                    d = d.astype(np.int32)
+                    ax1.add_patch(
+                        patches.Rectangle(
+                            (d[0], d[1]),
+                            d[2] - d[0],
+                            d[3] - d[1],
+                            fill=False,
+                            lw=3,
+                            ec=colours[d[4] % 32, :],
+                        )
+                    )
+                fig.canvas.flush_events()
+                plt.draw()
+                ax1.cla()
+
+    if args.timings:
+        TIMINGS.export()
+    return seq, total_frames, total_time
+
+
+def _track_sequence_job(job):
+    """Runs :func:`track_sequence` on a (seq_dets_fn, seq, args) job of the process pool."""
+    return track_sequence(*job)
+
+
+def track_sequences(sequences, args):
+    """Tracks the (seq_dets_fn, seq) sequences over a pool of args.workers processes.
+
+    Yields (seq, frames, seconds) as the sequences complete.
+    """
+    jobs = [(seq_dets_fn, seq, args) for seq_dets_fn, seq in sequences]
+    workers = args.workers or os.cpu_count()
+    if workers == 1:
+        for job in jobs:
+            yield _track_sequence_job(job)
+        return
+
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    with ProcessPoolExecutor(max_workers=min(workers, max(len(jobs), 1))) as pool:
+        futures = [pool.submit(_track_sequence_job, job) for job in jobs]
+        for future in as_completed(futures):
+            yield future.result()
+
+
 if __name__ == "__main__":
     """SORT: A Simple Online and Realtime Tracker"""
     args = parse_args()
@@ -300,81 +1188,62 @@ if __name__ == "__main__":
     phase = args.phase
     total_time = 0.0
     total_frames = 0
+    np.random.seed(0)
     colours = np.random.rand(32, 3)  # used only for display
+    view = None
     if display:
+        # display dependencies are only loaded by the demo
+        import matplotlib
+
+        matplotlib.use("TkAgg")
+        import matplotlib.pyplot as plt
+
         if not os.path.exists("mot_benchmark"):
-            print(
-                "\n\tERROR: mot_benchmark link not found!\n\n\
+            print("\n\tERROR: mot_benchmark link not found!\n\n\
                 Create a symbolic link to the MOT benchmark\n\
                 (https://motchallenge.net/data/2D_MOT_2015/#download). E.g.:\n\n\
-                $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n"
-            )
+                $ ln -s /path/to/MOT2015_challenge/2DMOT2015 mot_benchmark\n\n")
             exit()
         plt.ion()
         fig = plt.figure()
         ax1 = fig.add_subplot(111, aspect="equal")
+        view = (fig, ax1, colours)
 
     if not os.path.exists("output"):
         os.makedirs("output")
     pattern = os.path.join(args.seq_path, phase, "*", "det", "det.txt")
-    for seq_dets_fn in glob.glob(pattern):
-        mot_tracker = Sort(
-            max_age=args.max_age,
-            min_hits=args.min_hits,
-            iou_threshold=args.iou_threshold,
-        )  # create instance of the SORT tracker
-        seq_dets = np.loadtxt(seq_dets_fn, delimiter=",")
-        seq = seq_dets_fn[pattern.find("*") :].split(os.path.sep)[0]
-
-        with open(os.path.join("output", "%s.txt" % (seq)), "w") as out_file:
-            print("Processing %s." % (seq))
-            for frame in range(int(seq_dets[:, 0].max())):
-                frame += 1  # detection and frame numbers begin at 1
-                dets = seq_dets[seq_dets[:, 0] == frame, 2:7]
-                dets[:, 2:4] += dets[:, 0:2]  # convert to [x1,y1,w,h] to [x1,y1,x2,y2]
-                total_frames += 1
-
-                if display:
-                    fn = os.path.join(
-                        "mot_benchmark", phase, seq, "img1", "%06d.jpg" % (frame)
-                    )
-                    im = io.imread(fn)
-                    ax1.imshow(im)
-                    plt.title(seq + " Tracked Targets")
-
-                start_time = time.time()
-                trackers = mot_tracker.update(dets)
-                cycle_time = time.time() - start_time
-                total_time += cycle_time
-
-                for d in trackers:
-                    print(
-                        "%d,%d,%.2f,%.2f,%.2f,%.2f,1,-1,-1,-1"
-                        % (frame, d[4], d[0], d[1], d[2] - d[0], d[3] - d[1]),
-                        file=out_file,
-                    )
-                    if display:
-                        d = d.astype(np.int32)
-                        ax1.add_patch(
-                            patches.Rectangle(
-                                (d[0], d[1]),
-                                d[2] - d[0],
-                                d[3] - d[1],
-                                fill=False,
-                                lw=3,
-                                ec=colours[d[4] % 32, :],
-                            )
-                        )
+    sequences = [
+        (seq_dets_fn, seq_dets_fn[pattern.find("*") :].split(os.path.sep)[0])
+        for seq_dets_fn in glob.glob(pattern)
+    ]
+    if args.order == "size":
+        # largest sequences first so that the pool does not wait on a late long one
+        sequences.sort(key=lambda s: os.path.getsize(s[0]), reverse=True)
+    else:
+        sequences.sort(key=lambda s: s[1])
 
-                if display:
-                    fig.canvas.flush_events()
-                    plt.draw()
-                    ax1.cla()
+    wall_start = time.time()
+    if display:
+        results = (track_sequence(fn, seq, args, view) for fn, seq in sequences)
+    else:
+        results = track_sequences(sequences, args)
+    for seq, frames, seconds in results:
+        total_time += seconds
+        total_frames += frames
+        print(
+            "%s: %d frames in %.3f seconds or %.1f FPS"
+            % (seq, frames, seconds, frames / max(seconds, 1e-9))
+        )
+    wall_time = time.time() - wall_start
 
     print(
         "Total Tracking took: %.3f seconds for %d frames or %.1f FPS"
         % (total_time, total_frames, total_frames / total_time)
     )
+    print(
+        "Wall time: %.3f seconds for %d sequences or %.1f FPS overall"
+        % (wall_time, len(sequences), total_frames / wall_time)
+    )
 
     if display:
         print("Note: to get real runtime results run without the option: --display")
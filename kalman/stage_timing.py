@@ -0,0 +1,179 @@
+"""Low-overhead timing of the stages of the tracking pipelines.
+
+Code wraps a stage in ``with TIMINGS.stage("iou"):``, or with the timer returned once by
+``TIMINGS.stage`` and kept. Timing is disabled by default, and a disabled timer only checks a
+flag, so instrumented code costs next to nothing when nobody is looking.
+"""
+
+import bisect
+import json
+import os
+import time
+
+import numpy as np
+
+# upper bounds in seconds of the histogram buckets, 4 per decade from 1 us to 10 s
+BUCKET_BOUNDS = [10.0 ** (e / 4.0) for e in range(-24, 5)]
+
+
+class StageTimer(object):
+    """Durations of one stage: totals, a histogram and a window of the latest ones.
+
+    A timer is not meant to be shared by threads running the same stage at once.
+    """
+
+    __slots__ = (
+        "name",
+        "timings",
+        "count",
+        "total",
+        "buckets",
+        "window",
+        "_n",
+        "_start",
+    )
+
+    def __init__(self, name, timings, window):
+        """Starts empty statistics of stage name."""
+        self.name = name
+        self.timings = timings
+        self.count = 0
+        self.total = 0.0
+        self.buckets = [0] * (len(BUCKET_BOUNDS) + 1)
+        self.window = np.zeros(window)
+        self._n = 0
+        self._start = None
+
+    def __enter__(self):
+        """Starts timing when enabled."""
+        if self.timings.enabled:
+            self._start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        """Records the duration since ``__enter__``."""
+        if self._start is not None:
+            self.record(time.perf_counter() - self._start)
+            self._start = None
+
+    def record(self, seconds):
+        """Records a duration measured elsewhere."""
+        self.count += 1
+        self.total += seconds
+        self.buckets[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+        self.window[self._n % len(self.window)] = seconds
+        self._n += 1
+
+    def summary(self):
+        """Returns the statistics, percentiles over the latest window of durations."""
+        ms = self.window[: min(self._n, len(self.window))] * 1000.0
+        result = {
+            "count": self.count,
+            "total_s": self.total,
+            "mean_ms": 1000.0 * self.total / self.count if self.count else 0.0,
+        }
+        for q in (50, 95, 99):
+            result["p%d_ms" % q] = float(np.percentile(ms, q)) if len(ms) else 0.0
+        return result
+
+
+class Timings(object):
+    """Registry of the :class:`StageTimer` of every stage, with periodic export.
+
+    ``enable`` turns timing on and optionally sets a file rewritten at most every interval
+    seconds by ``tick``, as JSON, or as Prometheus text when its name ends with ``.prom``.
+    """
+
+    def __init__(self, window=1024):
+        """Starts disabled, keeping the latest window durations of every stage."""
+        self.enabled = False
+        self.window = window
+        self.stages = {}
+        self.export_path = None
+        self.interval = 10.0
+        self._last_export = 0.0
+
+    def stage(self, name):
+        """Returns the timer of stage name, created on first use."""
+        timer = self.stages.get(name)
+        if timer is None:
+            timer = self.stages[name] = StageTimer(name, self, self.window)
+        return timer
+
+    def enable(self, export_path=None, interval=10.0):
+        """Turns timing on, exporting to export_path every interval seconds when given."""
+        self.enabled = True
+        self.export_path = export_path
+        self.interval = interval
+        self._last_export = time.time()
+
+    def disable(self):
+        """Turns timing off, the statistics are kept."""
+        self.enabled = False
+
+    def reset(self):
+        """Forgets the statistics of every stage."""
+        for name in list(self.stages):
+            self.stages[name].__init__(name, self, self.window)
+
+    def tick(self):
+        """Exports when the interval has passed, cheap enough to call every frame."""
+        if self.export_path and time.time() - self._last_export >= self.interval:
+            self.export()
+
+    def export(self, path=None):
+        """Writes the statistics to path, the export path by default, atomically."""
+        path = path or self.export_path
+        if path.endswith(".prom"):
+            text = self.prometheus()
+        else:
+            text = json.dumps(self.summary(), indent=2)
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w") as f:
+            f.write(text)
+        os.replace(tmp_path, path)
+        self._last_export = time.time()
+
+    def summary(self):
+        """Returns the statistics of every stage that ran."""
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "stages": {
+                name: timer.summary()
+                for name, timer in self.stages.items()
+                if timer.count
+            },
+        }
+
+    def prometheus(self):
+        """Returns the histograms in the Prometheus text exposition format."""
+        metric = "sort_stage_duration_seconds"
+        lines = [
+            "# HELP %s Duration of the tracking pipeline stages." % metric,
+            "# TYPE %s histogram" % metric,
+        ]
+        for name, timer in self.stages.items():
+            if not timer.count:
+                continue
+            cumulative = np.cumsum(timer.buckets)
+            for bound, count in zip(BUCKET_BOUNDS, cumulative):
+                lines.append(
+                    '%s_bucket{stage="%s",le="%.3g"} %d' % (metric, name, bound, count)
+                )
+            lines.append(
+                '%s_bucket{stage="%s",le="+Inf"} %d' % (metric, name, timer.count)
+            )
+            lines.append('%s_sum{stage="%s"} %.9f' % (metric, name, timer.total))
+            lines.append('%s_count{stage="%s"} %d' % (metric, name, timer.count))
+        return "\n".join(lines) + "\n"
+
+    def table(self):
+        """Returns the statistics as printable lines."""
+        return "\n".join(
+            "%-18s %8d calls  total %9.3f s  mean %8.3f ms  p95 %8.3f ms"
+            % (name, s["count"], s["total_s"], s["mean_ms"], s["p95_ms"])
+            for name, s in self.summary()["stages"].items()
+        )
+
+
+TIMINGS = Timings()
@@ -0,0 +1,104 @@
+"""Parameter sweep of SORT over the cached person detections of a video."""
+
+import argparse
+import itertools
+import os
+import time
+
+from detection_cache import DEFAULT_DET_CACHE_DIR, DetectionCache
+from detector import DEFAULT_CACHE_DIR, PersonDetector
+from mot_io import TrackResultWriter
+from sort import BatchSort, KalmanBoxTracker
+
+
+def track_detections(detections, output, max_age, min_hits, iou_threshold):
+    """Tracks the cached detections of every frame, writing MOT results to output."""
+    KalmanBoxTracker.count = 0
+    mot_tracker = BatchSort(
+        max_age=max_age, min_hits=min_hits, iou_threshold=iou_threshold
+    )
+    with TrackResultWriter(output) as writer:
+        for frame, dets in enumerate(detections):
+            writer.add(frame + 1, mot_tracker.update(dets))
+
+
+def parse_args():
+    """Parse input arguments."""
+    parser = argparse.ArgumentParser(description="SORT parameter sweep")
+    parser.add_argument("video", help="Recorded video", type=str)
+    parser.add_argument(
+        "--max_age",
+        help="Values of max_age [1 5 30]",
+        type=int,
+        nargs="+",
+        default=[1, 5, 30],
+    )
+    parser.add_argument(
+        "--min_hits",
+        help="Values of min_hits [1 3 5]",
+        type=int,
+        nargs="+",
+        default=[1, 3, 5],
+    )
+    parser.add_argument(
+        "--iou_threshold",
+        help="Values of iou_threshold [0.1 0.3 0.5]",
+        type=float,
+        nargs="+",
+        default=[0.1, 0.3, 0.5],
+    )
+    parser.add_argument(
+        "--output", help="Directory of the results [sweep]", default="sweep"
+    )
+    parser.add_argument(
+        "--det_cache",
+        help="Detection cache directory [%s]" % DEFAULT_DET_CACHE_DIR,
+        default=DEFAULT_DET_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--model", help="YOLOv5 model name [yolov5s]", type=str, default="yolov5s"
+    )
+    parser.add_argument(
+        "--cache_dir",
+        help="Directory of the cached model [%s]" % DEFAULT_CACHE_DIR,
+        type=str,
+        default=DEFAULT_CACHE_DIR,
+    )
+    parser.add_argument(
+        "--conf", help="Detection confidence threshold [0.25]", type=float, default=0.25
+    )
+    parser.add_argument(
+        "--batch_size", help="Frames per forward pass [8]", type=int, default=8
+    )
+    return parser.parse_args()
+
+
+if __name__ == "__main__":
+    args = parse_args()
+    detector = PersonDetector(args.model, args.cache_dir, conf=args.conf)
+    cache = DetectionCache(args.det_cache)
+
+    start_time = time.time()
+    detections = cache.load(args.video, detector)
+    if detections is None:
+        detections = cache.build(args.video, detector, args.batch_size)
+        print(
+            "Detected %d frames in %.1f s" % (len(detections), time.time() - start_time)
+        )
+    os.makedirs(args.output, exist_ok=True)
+
+    total_time = 0.0
+    configs = list(itertools.product(args.max_age, args.min_hits, args.iou_threshold))
+    for max_age, min_hits, iou_threshold in configs:
+        output = os.path.join(
+            args.output, "age%d_hits%d_iou%g.txt" % (max_age, min_hits, iou_threshold)
+        )
+        start_time = time.time()
+        track_detections(detections, output, max_age, min_hits, iou_threshold)
+        cycle_time = time.time() - start_time
+        total_time += cycle_time
+        print("%s: %.1f FPS" % (output, len(detections) / cycle_time))
+    print(
+        "Tracked %d configurations of %d frames in %.3f s"
+        % (len(configs), len(detections), total_time)
+    )